@@ -29,14 +29,20 @@ def byPercentage(pair):
     return pair[1]
 
 def writeMoves(board, moves, count, numSimulations):
+    """
+    numSimulations is the number of simulations of every move, or a list
+    of the simulations of each move.
+    """
+    if not isinstance(numSimulations, list):
+        numSimulations = [numSimulations] * len(moves)
     gtp_moves = []
     for i in range(len(moves)):
+        rate = float(count[i])/float(numSimulations[i]) if numSimulations[i] else 0.0
         if moves[i] != None:
             x, y = board._point_to_coord(moves[i])
-            gtp_moves.append((GoBoardUtil.format_point((x, y)),
-                          float(count[i])/float(numSimulations)))
+            gtp_moves.append((GoBoardUtil.format_point((x, y)), rate))
         else:
-            gtp_moves.append(('Pass',float(count[i])/float(numSimulations)))
+            gtp_moves.append(('Pass', rate))
     sys.stderr.write("win rates: {}\n"
                      .format(sorted(gtp_moves, key = byPercentage,
                                                reverse = True)))
@@ -61,6 +67,9 @@ class Go3Player(object):
         self.random_simulation = True if simulations == 'random' else False
         self.use_pattern = not self.random_simulation
         self.check_selfatari = move_filter
+        # stop simulating a move once it cannot beat the best move so far
+        self.early_stop = True
+        self.simulations_saved = 0
  
     def simulate(self, board, cboard, move, toplay):
         GoBoardUtil.copyb2b(board,cboard)
@@ -75,21 +84,23 @@ class Go3Player(object):
                 use_pattern = self.use_pattern,
                 check_selfatari= self.check_selfatari)
 
-    def simulateMove(self, board, cboard, move, toplay):
+    def simulateMove(self, board, cboard, move, toplay, target=None):
+        """
+        Return (wins, simulations) of move. With a target, the
+        simulations stop once wins can no longer exceed it.
+        """
         wins = 0
-        for _ in range(self.num_simulation):
+        for n in range(self.num_simulation):
+            if target is not None and wins + self.num_simulation - n <= target:
+                return wins, n
             result = self.simulate(board, cboard, move, toplay)
             if result == toplay:
                 wins += 1
-        return wins
+        return wins, self.num_simulation
     
     def get_move(self, board, toplay):
         cboard = board.copy()
-        emptyPoints = board.get_empty_points()
-        moves = []
-        for p in emptyPoints:
-            if board.check_legal(p, toplay):
-                moves.append(p)
+        moves = np.flatnonzero(board.legal_mask(toplay, exclude_eyes=False)).tolist()
         if not moves: # pass move only, no need to simulate
             return None
         moves.append(None) # None for Pass
@@ -99,10 +110,20 @@ class Go3Player(object):
             return best
         else:
             moveWins = []
+            moveSimulations = []
             for move in moves:
-                wins = self.simulateMove(board, cboard, move, toplay)
+                # select_best_move keeps the first of equal moves, so a
+                # later move must win more often than the best so far
+                target = max(moveWins) if self.early_stop and moveWins else None
+                wins, simulations = self.simulateMove(board, cboard, move, toplay, target)
                 moveWins.append(wins)
-            writeMoves(board, moves, moveWins, self.num_simulation)
+                moveSimulations.append(simulations)
+            self.simulations_saved = len(moves) * self.num_simulation - sum(moveSimulations)
+            writeMoves(board, moves, moveWins, moveSimulations)
+            if self.simulations_saved:
+                sys.stderr.write("Stopped early, {} of {} simulations saved\n"
+                                 .format(self.simulations_saved, len(moves) * self.num_simulation))
+                sys.stderr.flush()
             return select_best_move(board, moves, moveWins)
 
     def get_properties(self):
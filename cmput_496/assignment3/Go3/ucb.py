@@ -63,10 +63,26 @@ def writeMoves(board, moves, stats):
                                                reverse = True)))
     sys.stderr.flush()
 
+# how often runUcb checks whether the most pulled arm is decided
+CHECK_INTERVAL = 10
+
+def leaderDecided(stats, remaining):
+    """
+    True if no other arm can get more pulls than the most pulled one
+    in the remaining pulls.
+    """
+    pulls = sorted((s[1] for s in stats), reverse = True)
+    return len(pulls) < 2 or pulls[0] - pulls[1] > remaining
+
 def runUcb(player, board, cboard, C, moves, toplay):
     stats = [[0,0] for _ in moves]
     num_simulation = len(moves) * player.num_simulation
+    player.simulations_saved = 0
     for n in range(num_simulation):
+        if player.early_stop and n % CHECK_INTERVAL == 0 \
+                and leaderDecided(stats, num_simulation - n):
+            player.simulations_saved = num_simulation - n
+            break
         moveIndex = findBest(stats, C, n)
         result = player.simulate(board, cboard, moves[moveIndex], toplay)
         if result == toplay:
@@ -75,5 +91,9 @@ def runUcb(player, board, cboard, C, moves, toplay):
     bestIndex = bestArm(stats)
     best = moves[bestIndex]
     writeMoves(board, moves, stats)
+    if player.simulations_saved:
+        sys.stderr.write("Stopped early, {} of {} simulations saved\n"
+                         .format(player.simulations_saved, num_simulation))
+        sys.stderr.flush()
     return best
 
@@ -5,7 +5,6 @@ BORDER = 3
 FLOODFILL = 4
 import numpy as np
 import random
-import copy
 from pattern import pat3set
 import sys
 
@@ -24,17 +23,7 @@ class GoBoardUtil(object):
         color : {'b','w'}
             the color to generate the move for.
         """
-        moves = board.get_empty_points()
-        num_moves = len(moves)
-        np.random.shuffle(moves)
-        illegal_moves = []
-
-        for i in range(num_moves):
-            if board.check_legal(moves[i],color):
-                continue
-            else:
-                illegal_moves.append(i)
-        legal_moves = np.delete(moves,illegal_moves)
+        legal_moves = np.flatnonzero(board.legal_mask(color, exclude_eyes=False))
         gtp_moves=[]
         for point in legal_moves:
             x,y = board._point_to_coord(point)
@@ -163,10 +152,8 @@ class GoBoardUtil(object):
          
     @staticmethod
     def copyb2b(board,copy_board):
-        """Return an independent copy of this Board."""
-        copy_board.__dict__ = copy.deepcopy(board.__dict__)
-        assert copy_board.board.all() == board.board.all()
-        return copy_board
+        """Copy board into copy_board, reusing its arrays, and return it."""
+        return board.copy_into(copy_board)
 
     @staticmethod
     def sorted_point_string(points, ns):
@@ -264,15 +251,8 @@ class GoBoardUtil(object):
 
     @staticmethod
     def generate_random_moves(board,is_eye_filter):
-        empty_points = board.get_empty_points()
         color = board.current_player
-        moves = []
-        for move in empty_points:
-            if is_eye_filter and board.is_eye(move,color):
-                continue 
-            if board.check_legal(move, color):
-                moves.append(move)
-        return moves
+        return np.flatnonzero(board.legal_mask(color, is_eye_filter)).tolist()
 
     @staticmethod 
     def generate_move_with_filter(board, use_pattern, check_selfatari):
@@ -14,7 +14,6 @@ glossary:
 
 
 import numpy as np
-import copy
 from board_util import GoBoardUtil, BLACK, WHITE, EMPTY, BORDER, FLOODFILL 
 import sys
 sys.setrecursionlimit(1000000)
@@ -111,6 +110,64 @@ class SimpleGoBoard(object):
         self.board[point] = EMPTY
         return is_legal
 
+    def legal_mask(self, color, exclude_eyes=True):
+        """
+        Boolean array over all maxpoint points, True where color can legally
+        play. It is worked out for all empty points at once from the liberty
+        counts of the blocks next to them, instead of calling check_legal
+        point by point.
+        If exclude_eyes is set, the eyes of color (see is_eye) are excluded.
+        """
+        board = self.board
+        opp = GoBoardUtil.opponent(color)
+        empty = np.array(self._empty_positions,dtype=np.int32)
+        nb_points = self._neighbor_table[empty]
+        nb = board[nb_points]
+        if self.check_suicide:
+            nb_libs = self._block_liberty_counts()[nb_points]
+            # not suicide: an empty neighbor, a friendly block that keeps a
+            # liberty or an opponent block that gets captured
+            legal = ((nb == EMPTY)
+                     | ((nb == color) & (nb_libs > 1))
+                     | ((nb == opp) & (nb_libs == 1))).any(axis=1)
+        else:
+            legal = np.ones((len(empty)),dtype=np.bool_)
+        if exclude_eyes:
+            eyeish = ((nb == color) | (nb == BORDER)).all(axis=1)
+            diag = board[self._diag_table[empty]]
+            false_count = (diag == opp).sum(axis=1) + (diag == BORDER).any(axis=1)
+            legal &= ~(eyeish & (false_count < 2))
+        mask = np.zeros((self.maxpoint),dtype=np.bool_)
+        mask[empty[legal]] = True
+        if self.ko_constraint is not None:
+            mask[self.ko_constraint] = False
+        return mask
+
+    def _block_liberty_counts(self):
+        """
+        Number of liberties of the block of every stone, 0 for the other
+        points. Each block is flood filled once.
+        """
+        board = self.board
+        counts = np.zeros((self.maxpoint),dtype=np.int32)
+        done = set()
+        for p in np.flatnonzero((board == BLACK) | (board == WHITE)).tolist():
+            if p in done:
+                continue
+            color = board[p]
+            block = [p]
+            done.add(p)
+            libs = set()
+            for s in block:
+                for n in self._neighbors(s):
+                    if board[n] == EMPTY:
+                        libs.add(n)
+                    elif board[n] == color and n not in done:
+                        done.add(n)
+                        block.append(n)
+            counts[block] = len(libs)
+        return counts
+
     def get_twoD_board(self):
         """
         Return: numpy array
@@ -208,6 +265,16 @@ class SimpleGoBoard(object):
                 if self.board[n] == BORDER:
                     continue
                 self.neighbors_dic[p].append(n)
+        # neighbors and diagonal neighbors of every point on the board for
+        # legal_mask, the rows of border points hold point 0
+        NS = self.NS
+        points = np.array(self._empty_positions)
+        self._neighbor_table = np.zeros((self.maxpoint, 4),dtype=np.int32)
+        self._neighbor_table[points] = points[:, None] + np.array([-1, 1, -NS, NS])
+        self._neighbor_table.flags.writeable = False
+        self._diag_table = np.zeros((self.maxpoint, 4),dtype=np.int32)
+        self._diag_table[points] = points[:, None] + np.array([-NS-1, -NS+1, NS-1, NS+1])
+        self._diag_table.flags.writeable = False
 
     def _neighbors(self,point):
     
@@ -216,12 +283,40 @@ class SimpleGoBoard(object):
     def _neighbor_pos(self, point):
         return [point-1, point+1, point-self.NS, point+self.NS]
 
+    # mutable lists that copy_into copies, everything else not copied
+    # explicitly is either immutable or a table shared by boards of a size
+    _copied_lists = ('moves', 'ko_constraints', 'captured_stones',
+                     'pass_record', '_empty_positions')
+
     def copy(self):
-        """Return an independent copy of this Board."""
-        copy_board = SimpleGoBoard(self.size)
-        copy_board.__dict__ = copy.deepcopy(self.__dict__)
-        assert copy_board.board.all() == self.board.all()
-        return copy_board
+        """
+        Return an independent copy of this Board.
+        neighbors_dic is shared with the copy, only the mutable state is copied.
+        """
+        copy_board = SimpleGoBoard.__new__(SimpleGoBoard)
+        return self.copy_into(copy_board)
+
+    def copy_into(self, dst):
+        """
+        Make dst an independent copy of this Board and return it.
+        If dst is a board of the same size its arrays are reused, so a
+        preallocated simulation board can be reset to this position
+        without building a new board.
+        """
+        board = getattr(dst, 'board', None)
+        liberty_dp = getattr(dst, 'liberty_dp', None)
+        dst.__dict__.update(self.__dict__)
+        if board is not None and board.shape == self.board.shape:
+            board[:] = self.board
+            liberty_dp[:] = self.liberty_dp
+        else:
+            board = self.board.copy()
+            liberty_dp = self.liberty_dp.copy()
+        dst.board = board
+        dst.liberty_dp = liberty_dp
+        for name in self._copied_lists:
+            setattr(dst, name, getattr(self, name)[:])
+        return dst
 
     def get_empty_points(self):
         """
@@ -9,28 +9,52 @@ sys.path.append(utilpath)
 from gtp_connection import GtpConnection
 from board_util_go4 import GoBoardUtilGo4
 from simple_board import SimpleGoBoard
-from mcts import MCTS
+from mcts import MCTS, rollout_pool
+from root_parallel import RootParallelMCTS
+from array_tree import PASS
+from time_manager import TimeManager
 import numpy as np
 import argparse
+import time
+import threading
 
 parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 parser.add_argument('--num_total_sim', type=int, default=300, help='number of simulations per move, so total playouts=sim*legal_moves')
 parser.add_argument('--simulations', type=str, default='random', help='type of simulation policy: random or rulebased or probabilistic')
 parser.add_argument('--movefilter', action='store_true', default=False, help='whether use move filter or not')
 parser.add_argument('--in_tree_knowledge', type=str, default='None', help='whether use move knowledge to initial a new node or not')
+parser.add_argument('--tree_store', type=str, default='objects', help='how the MCTS tree is stored: objects (TreeNode) or arrays (numpy)')
+parser.add_argument('--workers', type=int, default=1, help='number of worker processes for parallel MCTS, 1 to search in this process')
+parser.add_argument('--parallel', type=str, default='root', help='parallel MCTS with more than one worker: root (a tree per worker) or tree (one shared array tree)')
+parser.add_argument('--rollout_workers', type=int, default=0, help='processes for the leaf rollouts set by the GTP command leaf_rollouts, 0 to play them in this process')
+parser.add_argument('--ponder', action='store_true', default=False, help='keep searching while waiting for the opponent')
+parser.add_argument('--transpositions', type=int, default=0, help='size of the MCTS transposition table, 0 to search a plain tree')
+parser.add_argument('--expand_threshold', type=int, default=0, help='visits a leaf needs before it is expanded')
+parser.add_argument('--max_nodes', type=int, default=0, help='node budget of the MCTS tree, 0 for no budget')
+parser.add_argument('--max_tree_mb', type=float, default=0, help='node budget of the MCTS tree in megabytes, 0 for no budget')
+parser.add_argument('--budget_policy', type=str, default='stop', help='at the node budget: stop (stop expanding) or prune (drop the least visited subtrees)')
+parser.add_argument('--gc_freeze', action='store_true', default=False, help='no garbage collection during the search, and freeze the objects alive after it')
+parser.add_argument('--rave', type=int, default=0, help='RAVE: the visits at which the own and AMAF win rates of a child weigh the same, 0 for plain UCT')
+parser.add_argument('--widening', type=float, default=0.0, help='progressive widening: a node with n visits has widening*sqrt(n) children, 0 for all of them')
 
 args = parser.parse_args()
 num_simulation = args.num_total_sim
 simulations = args.simulations
 move_filter = args.movefilter
 in_tree_knowledge = args.in_tree_knowledge
-
-def count_at_depth(node, depth, nodesAtDepth):
-    if not node._expanded:
-        return
-    nodesAtDepth[depth] += 1
-    for _,child in node._children.items():
-        count_at_depth(child, depth+1, nodesAtDepth)
+tree_store = args.tree_store
+transpositions = args.transpositions
+ponder = args.ponder
+workers = args.workers
+parallel = args.parallel
+rollout_workers = args.rollout_workers
+expand_threshold = args.expand_threshold
+widening = args.widening
+max_nodes = args.max_nodes
+max_tree_mb = args.max_tree_mb
+budget_policy = args.budget_policy
+gc_freeze = args.gc_freeze
+rave = args.rave
 
 class Go5Player():
     def __init__(self, num_simulation, limit=100, exploration = 0.4):
@@ -46,7 +70,27 @@ class Go5Player():
         """
         self.name = "Go5"
         self.version = 0.22
-        self.MCTS = MCTS()
+        self.tree_store = tree_store
+        self.transpositions = transpositions
+        self.workers = workers
+        if self.workers > 1 and parallel == 'tree':
+            # multiprocessing.shared_memory needs Python 3.8, so it is only
+            # imported for tree parallel search
+            from tree_parallel import TreeParallelMCTS
+            self.MCTS = TreeParallelMCTS(self.workers)
+        elif self.workers > 1:
+            self.MCTS = RootParallelMCTS(self.workers, self.tree_store, self.transpositions)
+        else:
+            self.MCTS = MCTS(self.tree_store, self.transpositions, rave)
+            self.MCTS.expand_threshold = expand_threshold
+            self.MCTS.widening = widening
+            # the smaller of the budgets in nodes and in bytes
+            budgets = [max_nodes] if max_nodes > 0 else []
+            if max_tree_mb > 0:
+                budgets.append(int(max_tree_mb * 2**20 / self.MCTS.tree.bytes_per_node))
+            self.MCTS.max_nodes = min(budgets) if budgets else 0
+            self.MCTS.budget_policy = budget_policy
+            self.MCTS.gc_freeze = gc_freeze
         self.num_simulation = num_simulation
         self.limit = limit
         self.exploration = exploration
@@ -55,6 +99,20 @@ class Go5Player():
         self.check_selfatari = move_filter
         self.in_tree_knowledge = in_tree_knowledge
         self.parent = None
+        # set through the GTP time commands; without them every move
+        # searches num_simulation playouts
+        self.time_manager = TimeManager()
+        # rollouts per leaf of the search, set by the GTP command leaf_rollouts
+        self.leaf_rollouts = 1
+        if rollout_workers > 0:
+            self.MCTS.rollout_pool = rollout_pool(rollout_workers)
+            self.MCTS.rollout_workers = rollout_workers
+        # with ponder, the search goes on in a background thread while the
+        # GTP connection waits for the next command
+        self.ponder = ponder
+        self._ponder_thread = None
+        self._ponder_stop = None
+        self._ponder_playouts = 0
 
     def sample_run(self, board, toplay, in_tree_knowledge, print_info=False):
         self.MCTS.exploration = self.exploration
@@ -63,21 +121,24 @@ class Go5Player():
         self.MCTS.use_pattern = True
         self.MCTS.check_selfatari = True
 
-        for n in range(self.num_simulation):
-            board_copy = board.copy()
-            self.MCTS._playout(board_copy, toplay, in_tree_knowledge)
+        self.MCTS._search(board, toplay, self.num_simulation, in_tree_knowledge)
 
         if print_info:
             self.MCTS.good_print(board, self.MCTS._root, toplay,self.num_nodes)
 
     def reset(self):
-        self.MCTS = MCTS()
+        # keeps the worker processes of root parallel search
+        self.MCTS.reset()
+        self.time_manager.reset()
 
     def update(self, move):
-        self.parent = self.MCTS._root
+        # keep the searched tree for mcts_info
+        self.parent = self.MCTS.tree
         self.MCTS.update_with_move(move)
 
     def get_move(self, board, toplay):
+        start = time.time()
+        self.MCTS.leaf_rollouts = self.leaf_rollouts
         move = self.MCTS.get_move(board,
                 toplay,
                 komi=self.komi,
@@ -87,16 +148,61 @@ class Go5Player():
                 num_simulation = self.num_simulation,
                 exploration = self.exploration,
                 simulation_policy = self.simulation_policy,
-                in_tree_knowledge = self.in_tree_knowledge)
+                in_tree_knowledge = self.in_tree_knowledge,
+                time_limit = self.time_manager.move_budget(board, toplay))
+        self.time_manager.spent(toplay, time.time() - start)
         self.update(move)
         return move
 
-    def get_node_depth(self, root):
+    def play(self, move, color):
+        """
+        Follow a move played on the board through GTP in the search tree,
+        so the next search starts from the subtree of the move. Without
+        ponder the tree is only kept for the player's own moves.
+        """
+        if not self.ponder:
+            return
+        if self.MCTS.toplay == color:
+            self.MCTS.update_with_move(PASS if move is None else move)
+        else:
+            # the tree root is not the position before the move
+            self.MCTS.clear_tree()
+
+    def start_pondering(self, board):
+        """
+        Search the position on board in a background thread until
+        stop_pondering, if ponder is on and the tree root is that position.
+        board must not change while pondering.
+        """
+        if not self.ponder or self._ponder_thread is not None:
+            return
+        # the settings of the search come from the last get_move
+        if self.MCTS.num_playouts == 0 or self.MCTS.toplay != board.current_player:
+            return
+        self._ponder_stop = threading.Event()
+        self._ponder_thread = threading.Thread(target=self._ponder,
+                args=(board, board.current_player, self._ponder_stop))
+        self._ponder_thread.daemon = True
+        self._ponder_thread.start()
+
+    def _ponder(self, board, toplay, stop):
+        self._ponder_playouts = self.MCTS.ponder(board, toplay, stop)
+
+    def stop_pondering(self):
+        """
+        Stop the pondering thread, if any, after its current playout.
+        """
+        if self._ponder_thread is None:
+            return
+        self._ponder_stop.set()
+        self._ponder_thread.join()
+        self._ponder_thread = None
+        sys.stderr.write("Pondered {} playouts \n".format(self._ponder_playouts))
+        sys.stderr.flush()
+
+    def get_node_depth(self, tree):
         MAX_DEPTH = 100
-        nodesAtDepth = [0] * MAX_DEPTH
-        count_at_depth(root, 0, nodesAtDepth)
-        prev_nodes = 1
-        return nodesAtDepth
+        return tree.nodes_at_depth(MAX_DEPTH)
 
     def get_properties(self):
         return dict(
@@ -117,4 +223,72 @@ if __name__=='__main__':
         sys.stderr.write('simulations must be random or rulebased or probabilistic \n')
         sys.stderr.flush()
         sys.exit(0)
+    if tree_store != "objects" and tree_store != "arrays":
+        sys.stderr.write('tree_store must be objects or arrays \n')
+        sys.stderr.flush()
+        sys.exit(0)
+    if workers < 1:
+        sys.stderr.write('workers must be at least 1 \n')
+        sys.stderr.flush()
+        sys.exit(0)
+    if parallel != "root" and parallel != "tree":
+        sys.stderr.write('parallel must be root or tree \n')
+        sys.stderr.flush()
+        sys.exit(0)
+    if parallel == "tree" and workers > 1 and transpositions > 0:
+        sys.stderr.write('tree parallel search does not use a transposition table \n')
+        sys.stderr.flush()
+        sys.exit(0)
+    if rollout_workers < 0:
+        sys.stderr.write('rollout_workers must not be negative \n')
+        sys.stderr.flush()
+        sys.exit(0)
+    if rollout_workers > 0 and workers > 1:
+        sys.stderr.write('rollout_workers does not work with more than one worker \n')
+        sys.stderr.flush()
+        sys.exit(0)
+    if ponder and workers > 1:
+        sys.stderr.write('ponder does not work with more than one worker \n')
+        sys.stderr.flush()
+        sys.exit(0)
+    if transpositions < 0:
+        sys.stderr.write('transpositions must not be negative \n')
+        sys.stderr.flush()
+        sys.exit(0)
+    if expand_threshold < 0 or widening < 0:
+        sys.stderr.write('expand_threshold and widening must not be negative \n')
+        sys.stderr.flush()
+        sys.exit(0)
+    if (expand_threshold > 0 or widening > 0) and workers > 1:
+        sys.stderr.write('expand_threshold and widening do not work with more than one worker \n')
+        sys.stderr.flush()
+        sys.exit(0)
+    if max_nodes < 0 or max_tree_mb < 0:
+        sys.stderr.write('max_nodes and max_tree_mb must not be negative \n')
+        sys.stderr.flush()
+        sys.exit(0)
+    if budget_policy != "stop" and budget_policy != "prune":
+        sys.stderr.write('budget_policy must be stop or prune \n')
+        sys.stderr.flush()
+        sys.exit(0)
+    if (max_nodes > 0 or max_tree_mb > 0) and workers > 1:
+        sys.stderr.write('a node budget does not work with more than one worker \n')
+        sys.stderr.flush()
+        sys.exit(0)
+    if gc_freeze and workers > 1:
+        sys.stderr.write('gc_freeze does not work with more than one worker \n')
+        sys.stderr.flush()
+        sys.exit(0)
+    if rave < 0:
+        sys.stderr.write('rave must not be negative \n')
+        sys.stderr.flush()
+        sys.exit(0)
+    if rave > 0 and workers > 1:
+        sys.stderr.write('rave does not work with more than one worker \n')
+        sys.stderr.flush()
+        sys.exit(0)
+    if widening > 0 and transpositions > 0:
+        sys.stderr.write('widening does not work with a transposition table \n')
+        sys.stderr.flush()
+        sys.exit(0)
     run()
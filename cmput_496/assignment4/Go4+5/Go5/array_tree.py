@@ -0,0 +1,352 @@
+"""
+MCTS tree stored in numpy arrays instead of TreeNode objects.
+"""
+import numpy as np
+
+PASS = 'pass'
+# the move array stores a pass as point 0, which is never a move on the board
+PASS_POINT = 0
+
+def uct_argmax(visits, black_wins, parent_visits, exploration, max_flag):
+    """
+    Index of the child with the largest UCT value, from the arrays of visits
+    and black wins of the children of a node with parent_visits visits.
+    Unvisited children have an infinite value. Ties go to the first child,
+    as with max() over the children.
+    """
+    unvisited = visits == 0
+    if parent_visits > 0 and unvisited.any():
+        return int(np.argmax(unvisited))
+    wins = black_wins if max_flag else visits - black_wins
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = wins / visits + exploration*np.sqrt(np.log(parent_visits) / visits)
+    values[unvisited] = float("inf")
+    if parent_visits > 0:
+        return int(np.argmax(values))
+    # children with prior visits under an unvisited node have value nan,
+    # where max() keeps the child it has, unlike argmax
+    best = 0
+    for i in range(1, len(values)):
+        if values[i] > values[best]:
+            best = i
+    return best
+
+def rave_argmax(visits, black_wins, amaf_visits, amaf_black_wins, parent_visits, exploration,
+                max_flag, rave):
+    """
+    Index of the child with the largest RAVE value, from the arrays of
+    visits, black wins and AMAF statistics of the children of a node with
+    parent_visits visits. The value of a child with n visits is its win
+    rate and its AMAF win rate blended with weight
+    beta = sqrt(rave / (3 * n + rave)) on the AMAF one, or its win rate
+    alone without AMAF visits (PASS never has any), plus the UCT
+    exploration term with n + 1 visits. A child with neither visits nor
+    AMAF visits has an infinite value. Ties go to the first child.
+    """
+    wins = black_wins if max_flag else visits - black_wins
+    amaf_wins = amaf_black_wins if max_flag else amaf_visits - amaf_black_wins
+    with np.errstate(divide='ignore', invalid='ignore'):
+        value = np.where(visits > 0, wins / visits, 0.0)
+        amaf_value = np.where(amaf_visits > 0, amaf_wins / amaf_visits, 0.0)
+    beta = np.where(amaf_visits > 0, np.sqrt(rave / (3.0 * visits + rave)), 0.0)
+    values = ((1 - beta) * value + beta * amaf_value
+              + exploration*np.sqrt(np.log(parent_visits + 1) / (visits + 1)))
+    values[(visits == 0) & (amaf_visits == 0)] = float("inf")
+    return int(np.argmax(values))
+
+class ArrayTree(object):
+    """
+    Tree store for MCTS where a node is an index into preallocated numpy
+    arrays, so the tree holds no Python object per node:
+
+    visits, black_wins : statistics of the node
+    first_child, num_children : the children of a node are the nodes
+        first_child .. first_child+num_children-1, first_child is -1 for
+        a node that is not expanded
+    num_moves : the nodes from first_child on reserved for the children,
+        more than num_children while progressive widening holds some
+        back, see widen
+    move : the move leading to the node, PASS_POINT for a pass
+    parent : the parent node, -1 for the root
+    amaf_visits, amaf_black_wins : the AMAF statistics of the node as a
+        child, in a tree made with amaf, see backup_amaf
+
+    The root is node 0. The arrays grow by CHUNK nodes when they are full.
+    It has the same interface as the NodeTree of TreeNode objects in mcts.py.
+    """
+    CHUNK = 4096
+    _fields = ('visits', 'black_wins', 'first_child', 'num_children', 'num_moves', 'move', 'parent')
+    _amaf_fields = ('amaf_visits', 'amaf_black_wins')
+    amaf = False
+
+    def __init__(self, capacity=CHUNK, amaf=False):
+        if amaf:
+            self.amaf = True
+            self._fields = self._fields + self._amaf_fields
+        for name in self._fields:
+            setattr(self, name, np.zeros((capacity),dtype=np.int32))
+        self.root = 0
+        self.size = 1
+        self.first_child[0] = -1
+        self.move[0] = PASS_POINT
+        self.parent[0] = -1
+
+    @property
+    def capacity(self):
+        return len(self.visits)
+
+    @property
+    def bytes_per_node(self):
+        return sum(getattr(self, name).itemsize for name in self._fields)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self._fields)
+
+    def num_nodes(self):
+        return self.size
+
+    def _reserve(self, n):
+        """
+        Make room for n more nodes, growing the arrays by whole chunks.
+        """
+        needed = self.size + n
+        if needed <= self.capacity:
+            return
+        capacity = self.capacity + ((needed - self.capacity) // self.CHUNK + 1) * self.CHUNK
+        for name in self._fields:
+            array = np.zeros((capacity),dtype=np.int32)
+            array[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, array)
+
+    def expanded(self, node):
+        return self.first_child[node] >= 0
+
+    def expand(self, node, moves, visits=None, black_wins=None, width=None):
+        """
+        Add children for moves, PASS included, to node.
+        visits and black_wins are the statistics the children start with.
+        With width, only the first width moves are children for now, the
+        nodes of the others are reserved after them for widen.
+        """
+        n = len(moves)
+        self._reserve(n)
+        first = self.size
+        children = slice(first, first + n)
+        self.move[children] = [PASS_POINT if m == PASS else m for m in moves]
+        self.visits[children] = 0 if visits is None else visits
+        self.black_wins[children] = 0 if black_wins is None else black_wins
+        self.first_child[children] = -1
+        self.num_children[children] = 0
+        self.num_moves[children] = 0
+        self.parent[children] = node
+        if self.amaf:
+            self.amaf_visits[children] = 0
+            self.amaf_black_wins[children] = 0
+        self.first_child[node] = first
+        self.num_children[node] = n if width is None else min(n, width)
+        self.num_moves[node] = n
+        self.size += n
+
+    def widen(self, node, width):
+        """
+        Make the first width moves of the expanded node its children.
+        """
+        if self.num_children[node] < width:
+            self.num_children[node] = min(width, self.num_moves[node])
+
+    def share(self, node, other):
+        """
+        Make the children of the expanded node other the children of node too.
+        The parent field of the children stays other.
+        """
+        self.first_child[node] = self.first_child[other]
+        self.num_children[node] = self.num_children[other]
+        self.num_moves[node] = self.num_moves[other]
+
+    def children(self, node):
+        """
+        List of (move, child) of node.
+        """
+        first = self.first_child[node]
+        if first < 0:
+            return []
+        return [(self.get_move(child), child)
+                for child in range(first, first + self.num_children[node])]
+
+    def child_visits(self, node):
+        """
+        Array of the visits of the children of node.
+        """
+        first = self.first_child[node]
+        if first < 0:
+            return self.visits[:0]
+        return self.visits[first:first + self.num_children[node]]
+
+    def get_move(self, node):
+        move = int(self.move[node])
+        return PASS if move == PASS_POINT else move
+
+    def get_visits(self, node):
+        return int(self.visits[node])
+
+    def get_black_wins(self, node):
+        return int(self.black_wins[node])
+
+    def uct_value(self, node, child, exploration, max_flag):
+        n = int(self.visits[child])
+        if n == 0:
+            return float("inf")
+        wins = int(self.black_wins[child])
+        if not max_flag:
+            wins = n - wins
+        return float(wins)/n + exploration*np.sqrt(np.log(int(self.visits[node]))/n)
+
+    def select(self, node, exploration, max_flag, rave=0):
+        """
+        Select the child with the largest UCT value, see uct_argmax, or
+        with rave > 0 in a tree made with amaf the largest RAVE value, see
+        rave_argmax.
+        Returns a tuple of (move, child)
+        """
+        first = int(self.first_child[node])
+        children = slice(first, first + self.num_children[node])
+        if rave and self.amaf:
+            child = first + rave_argmax(self.visits[children], self.black_wins[children],
+                                        self.amaf_visits[children], self.amaf_black_wins[children],
+                                        int(self.visits[node]), exploration, max_flag, rave)
+        else:
+            child = first + uct_argmax(self.visits[children], self.black_wins[children],
+                                       int(self.visits[node]), exploration, max_flag)
+        return self.get_move(child), child
+
+    def update(self, node, leaf_value, n=1):
+        self.black_wins[node] += leaf_value
+        self.visits[node] += n
+
+    def backup(self, path, leaf_value, n=1):
+        """
+        Update the nodes on path, from the root to the leaf, with
+        leaf_value black wins out of n leaf evaluations.
+        """
+        path = np.asarray(path)
+        self.black_wins[path] += leaf_value
+        self.visits[path] += n
+
+    def backup_batch(self, paths, leaf_values):
+        """
+        Back up several leaf evaluations, one per path, in one update of
+        the arrays. Paths may share nodes.
+        """
+        nodes = np.concatenate([np.asarray(path) for path in paths])
+        values = np.repeat(np.asarray(leaf_values), [len(path) for path in paths])
+        np.add.at(self.black_wins, nodes, values)
+        np.add.at(self.visits, nodes, 1)
+
+    def backup_amaf(self, path, played, leaf_value):
+        """
+        Update the AMAF statistics of the children of the expanded nodes
+        on path with the playout of leaf_value black wins. played is the
+        pair of arrays of MCTS._amaf_played: a child of the node at depth d
+        counts the playout if its move was played at depth d or later by
+        the player to play at the node.
+        """
+        for depth, node in enumerate(path):
+            first = int(self.first_child[node])
+            if first < 0:
+                continue
+            children = slice(first, first + self.num_children[node])
+            counted = played[depth % 2][self.move[children]] >= depth
+            self.amaf_visits[children] += counted
+            if leaf_value:
+                self.amaf_black_wins[children] += counted
+
+    def subtree(self, move):
+        """
+        Return a new ArrayTree holding the subtree below the root child for
+        move, or an empty tree if the root has no such child.
+        The nodes are copied one block of children at a time, so the copy
+        is compact and this tree is left unchanged. A block shared by
+        several nodes is copied once.
+        """
+        new_root = None
+        for m, child in self.children(self.root):
+            if m == move:
+                new_root = child
+                break
+        if new_root is None:
+            return ArrayTree(self.capacity, self.amaf)
+        return self._copy(new_root)
+
+    def pruned(self, min_visits):
+        """
+        Return a compact copy of this tree in which the expanded nodes below
+        the root with fewer than min_visits visits are leaves, without their
+        subtrees.
+        """
+        return self._copy(self.root, min_visits)
+
+    def expansions(self):
+        """
+        Arrays of the visits and of the number of children of the expanded
+        nodes, the root first.
+        """
+        nodes = np.flatnonzero(self.first_child[:self.size] >= 0)
+        nodes = np.concatenate(([self.root], nodes[nodes != self.root]))
+        return self.visits[nodes].astype(np.int64), self.num_moves[nodes].astype(np.int64)
+
+    def _copy(self, new_root, min_visits=0):
+        """
+        Return a new ArrayTree of the subtree below new_root, leaving out
+        the children of nodes below new_root with fewer than min_visits
+        visits.
+        """
+        tree = ArrayTree(self.capacity, self.amaf)
+        tree.visits[0] = self.visits[new_root]
+        tree.black_wins[0] = self.black_wins[new_root]
+        tree.move[0] = self.move[new_root]
+        # (node in this tree, node in the new tree) of expanded nodes
+        queue = [(new_root, 0)] if self.expanded(new_root) else []
+        # first child in this tree -> first child in the new tree
+        copied = {}
+        for old, new in queue:
+            first = int(self.first_child[old])
+            n = self.num_moves[old]
+            if first in copied:
+                tree.first_child[new] = copied[first]
+                tree.num_children[new] = self.num_children[old]
+                tree.num_moves[new] = n
+                continue
+            new_first = tree.size
+            copied[first] = new_first
+            src = slice(first, first + n)
+            dst = slice(new_first, new_first + n)
+            for name in ('visits', 'black_wins', 'move') + (self._amaf_fields if self.amaf else ()):
+                getattr(tree, name)[dst] = getattr(self, name)[src]
+            tree.first_child[dst] = -1
+            tree.parent[dst] = new
+            tree.first_child[new] = new_first
+            tree.num_children[new] = self.num_children[old]
+            tree.num_moves[new] = n
+            tree.size += n
+            expanded = (self.first_child[src] >= 0) & (self.visits[src] >= min_visits)
+            for i in np.flatnonzero(expanded).tolist():
+                queue.append((first + i, new_first + i))
+        return tree
+
+    def nodes_at_depth(self, max_depth):
+        """
+        Number of expanded nodes at each depth below the root.
+        """
+        counts = [0] * max_depth
+        level = np.array([self.root])
+        depth = 0
+        while depth < max_depth:
+            level = np.unique(level[self.first_child[level] >= 0])
+            if len(level) == 0:
+                break
+            counts[depth] = len(level)
+            level = np.concatenate([np.arange(f, f + n) for f, n in
+                                    zip(self.first_child[level], self.num_children[level])])
+            depth += 1
+        return counts
@@ -0,0 +1,424 @@
+#!/usr/bin/python3
+"""
+Benchmarks for the Go5 MCTS player.
+Each benchmark runs searches from the empty board and prints its numbers
+to stdout, e.g.
+
+    python3 benchmark.py rewind --size 9 --sims 300
+"""
+import os, sys
+utilpath = sys.path[0] + "/../util/"
+sys.path.append(utilpath)
+import argparse
+import gc
+import multiprocessing
+import random
+import time
+import tracemalloc
+import numpy as np
+from simple_board import SimpleGoBoard
+from board_util_go4 import GoBoardUtilGo4, BLACK, WHITE
+from mcts import MCTS, rollout_pool, expansion
+from root_parallel import RootParallelMCTS
+from tree_parallel import TreeParallelMCTS
+
+
+def run_search(board, num_simulation, komi=6.5, limit=100, simulation_policy='random', mcts=None,
+               time_limit=None, in_tree_knowledge='None'):
+    """
+    Run one get_move search and return (MCTS, seconds).
+    The statistics printed by get_move are discarded.
+    """
+    if mcts is None:
+        mcts = MCTS()
+    stderr = sys.stderr
+    sys.stderr = open(os.devnull, 'w')
+    try:
+        start = time.time()
+        mcts.get_move(board, board.current_player,
+                      komi=komi,
+                      limit=limit,
+                      check_selfatari=False,
+                      use_pattern=True,
+                      num_simulation=num_simulation,
+                      exploration=0.4,
+                      simulation_policy=simulation_policy,
+                      in_tree_knowledge=in_tree_knowledge,
+                      time_limit=time_limit)
+        elapsed = time.time() - start
+    finally:
+        sys.stderr.close()
+        sys.stderr = stderr
+    return mcts, elapsed
+
+
+def seed(value):
+    random.seed(value)
+    np.random.seed(value)
+
+
+def rewind_benchmark(args):
+    """
+    Simulations per second for each way MCTS.rewind brings the board
+    back to the root position after a playout.
+    """
+    for rewind in ('copy', 'undo', 'snapshot'):
+        seed(args.seed)
+        mcts = MCTS()
+        mcts.rewind = rewind
+        mcts, elapsed = run_search(SimpleGoBoard(args.size), args.sims,
+                                simulation_policy=args.policy, mcts=mcts)
+        print("{}: {:.1f} simulations/sec".format(rewind, mcts.num_playouts / elapsed))
+
+
+def tree_benchmark(args):
+    """
+    Nodes, memory per node and simulations per second of a search
+    with each MCTS tree store. Memory is measured with tracemalloc
+    in a second, untimed search.
+    """
+    for tree_store in ('objects', 'arrays'):
+        seed(args.seed)
+        mcts, elapsed = run_search(SimpleGoBoard(args.size), args.sims,
+                                   simulation_policy=args.policy, mcts=MCTS(tree_store))
+        seed(args.seed)
+        tracemalloc.start()
+        mcts, _ = run_search(SimpleGoBoard(args.size), args.sims,
+                             simulation_policy=args.policy, mcts=MCTS(tree_store))
+        tree_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        nodes = mcts.tree.num_nodes()
+        print("{}: {} nodes, {:.0f} bytes/node, {:.1f} simulations/sec".format(
+            tree_store, nodes, float(tree_bytes) / nodes, mcts.num_playouts / elapsed))
+
+def transposition_benchmark(args):
+    """
+    Nodes and simulations per second of a search with and without
+    a transposition table, for each MCTS tree store.
+    """
+    for tree_store in ('objects', 'arrays'):
+        for transpositions in (0, args.table):
+            seed(args.seed)
+            mcts, elapsed = run_search(SimpleGoBoard(args.size), args.sims,
+                                       simulation_policy=args.policy,
+                                       mcts=MCTS(tree_store, transpositions))
+            if transpositions:
+                shared = ", {} shared expansions".format(mcts.table.hits)
+            else:
+                shared = ""
+            print("{}, table {}: {} nodes{}, {:.1f} simulations/sec".format(
+                tree_store, transpositions, mcts.tree.num_nodes(), shared, mcts.num_playouts / elapsed))
+
+def root_parallel_benchmark(args):
+    """
+    Simulations per second and scaling efficiency of root parallel search
+    for 1 to args.workers worker processes, against the rate of a single
+    process search. Efficiency is the speedup divided by the workers.
+    The workers are started and warmed up with one search before timing.
+    The workers only run in parallel with as many free cores; on fewer
+    cores the figures show the overhead of the processes, not scaling.
+    """
+    seed(args.seed)
+    mcts, elapsed = run_search(SimpleGoBoard(args.size), args.sims,
+                               simulation_policy=args.policy)
+    serial_rate = mcts.num_playouts / elapsed
+    print("serial: {:.1f} simulations/sec".format(serial_rate))
+    num_workers = 1
+    while num_workers <= args.workers:
+        mcts = RootParallelMCTS(num_workers, seed=args.seed)
+        try:
+            run_search(SimpleGoBoard(args.size), num_workers, mcts=mcts)
+            mcts.reset()
+            mcts, elapsed = run_search(SimpleGoBoard(args.size), args.sims,
+                                       simulation_policy=args.policy, mcts=mcts)
+        finally:
+            mcts.close()
+        rate = mcts.num_playouts / elapsed
+        print("{} workers: {:.1f} simulations/sec, speedup {:.2f}, efficiency {:.2f}".format(
+            num_workers, rate, rate / serial_rate, rate / serial_rate / num_workers))
+        num_workers *= 2
+
+def tree_parallel_benchmark(args):
+    """
+    Playouts and nodes of a single process search and of tree parallel
+    search with 1 to args.workers workers, all given args.seconds per
+    search. Early stop is off, so every search uses all its time.
+    The workers only run in parallel with as many free cores; on fewer
+    cores the figures show the overhead of the processes, not scaling.
+    """
+    seed(args.seed)
+    mcts = MCTS('arrays')
+    mcts.early_stop = False
+    mcts, _ = run_search(SimpleGoBoard(args.size), 0, simulation_policy=args.policy,
+                         mcts=mcts, time_limit=args.seconds)
+    serial = mcts.num_playouts
+    print("serial: {} playouts, {} nodes".format(serial, mcts.tree.num_nodes()))
+    num_workers = 1
+    while num_workers <= args.workers:
+        mcts = TreeParallelMCTS(num_workers, seed=args.seed)
+        try:
+            run_search(SimpleGoBoard(args.size), num_workers, mcts=mcts)
+            mcts.reset()
+            mcts, _ = run_search(SimpleGoBoard(args.size), 0, simulation_policy=args.policy,
+                                 mcts=mcts, time_limit=args.seconds)
+            nodes = mcts.tree.num_nodes()
+        finally:
+            mcts.close()
+        print("{} workers: {} playouts, {} nodes, {:.2f} x serial".format(
+            num_workers, mcts.num_playouts, nodes, float(mcts.num_playouts) / serial))
+        num_workers *= 2
+
+def leaf_benchmark(args):
+    """
+    Playouts and rollouts per second of leaf parallel search, with 1, 4
+    and 16 rollouts per leaf, played in this process and in a pool of
+    args.workers processes. Each search runs args.sims rollouts.
+    """
+    pool = rollout_pool(args.workers)
+    try:
+        for workers in (0, args.workers):
+            for leaf_rollouts in (1, 4, 16):
+                seed(args.seed)
+                mcts = MCTS()
+                mcts.leaf_rollouts = leaf_rollouts
+                if workers:
+                    mcts.rollout_pool = pool
+                    mcts.rollout_workers = workers
+                mcts, elapsed = run_search(SimpleGoBoard(args.size),
+                                           max(1, args.sims // leaf_rollouts),
+                                           simulation_policy=args.policy, mcts=mcts)
+                print("{} workers, {} rollouts/leaf: {:.1f} playouts/sec, {:.1f} rollouts/sec".format(
+                    workers, leaf_rollouts, mcts.num_playouts / elapsed,
+                    mcts.num_playouts * leaf_rollouts / elapsed))
+    finally:
+        pool.close()
+        pool.join()
+
+def lazy_benchmark(args):
+    """
+    Nodes, tree memory and simulations per second of a search that expands
+    every leaf with all its children, against deferred expansion with
+    args.threshold and progressive widening with args.widening, alone and
+    together. Memory is measured with tracemalloc in a second, untimed
+    search, as in tree_benchmark.
+    """
+    for threshold, widening in ((0, 0.0), (args.threshold, 0.0),
+                                (0, args.widening), (args.threshold, args.widening)):
+        def search():
+            seed(args.seed)
+            mcts = MCTS()
+            mcts.expand_threshold = threshold
+            mcts.widening = widening
+            return run_search(SimpleGoBoard(args.size), args.sims,
+                              simulation_policy=args.policy, mcts=mcts)
+        mcts, elapsed = search()
+        tracemalloc.start()
+        mcts, _ = search()
+        tree_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print("threshold {}, widening {}: {} nodes, {:.0f} KB, {:.1f} simulations/sec".format(
+            threshold, widening, mcts.tree.num_nodes(), tree_bytes / 1024.0,
+            mcts.num_playouts / elapsed))
+
+def priors_benchmark(args):
+    """
+    Milliseconds per expansion without in-tree knowledge and with
+    probabilistic priors, over the positions of a random game, and
+    simulations per second of a search with each.
+    """
+    seed(args.seed)
+    board = SimpleGoBoard(args.size)
+    boards = []
+    while not board.end_of_game() and len(boards) < 2 * args.size * args.size:
+        boards.append(board.copy())
+        board.move(GoBoardUtilGo4.generate_random_move(board, board.current_player, True),
+                   board.current_player)
+    for in_tree_knowledge in ('None', 'probabilistic'):
+        # the first expansion builds the feature tables
+        expansion(boards[0], boards[0].current_player, in_tree_knowledge)
+        start = time.time()
+        for _ in range(10):
+            for b in boards:
+                expansion(b, b.current_player, in_tree_knowledge)
+        expand_ms = (time.time() - start) * 1000 / (10 * len(boards))
+        seed(args.seed)
+        mcts, elapsed = run_search(SimpleGoBoard(args.size), args.sims,
+                                   simulation_policy=args.policy,
+                                   in_tree_knowledge=in_tree_knowledge)
+        print("{}: {:.3f} ms/expansion, {:.1f} simulations/sec".format(
+            in_tree_knowledge, expand_ms, mcts.num_playouts / elapsed))
+
+def rss_mb():
+    """
+    Resident set size of this process in megabytes, read from /proc (Linux).
+    """
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2.0**20
+
+def _self_play(config):
+    """
+    Play a game against itself with one MCTS, reusing the tree from move
+    to move. config is (size, sims, policy, seed, tree_store, settings),
+    settings a dict of MCTS attributes. Returns, for each move, the nodes
+    after the search, the seconds of the search and the seconds of
+    garbage collection during it, and the RSS every ten moves.
+    """
+    size, sims, policy, random_seed, tree_store, settings = config
+    seed(random_seed)
+    mcts = MCTS(tree_store)
+    for name, value in settings.items():
+        setattr(mcts, name, value)
+    # time every collection of the garbage collector
+    collections = []
+    def gc_timer(phase, info):
+        if phase == 'start':
+            collections.append(-time.perf_counter())
+        else:
+            collections[-1] += time.perf_counter()
+    gc.callbacks.append(gc_timer)
+    board = SimpleGoBoard(size)
+    nodes = []
+    seconds = []
+    gc_seconds = []
+    rss = []
+    while not board.end_of_game() and len(board.moves) < 2 * size * size:
+        del collections[:]
+        mcts, elapsed = run_search(board, sims, simulation_policy=policy, mcts=mcts)
+        seconds.append(elapsed)
+        gc_seconds.append(sum(collections))
+        nodes.append(mcts.tree.num_nodes())
+        # the move get_move chose, the most visited
+        tree = mcts.tree
+        move = max(tree.children(tree.root), key=lambda child: tree.get_visits(child[1]))[0]
+        mcts.update_with_move(move)
+        board.move(None if move == 'pass' else move, board.current_player)
+        if len(board.moves) % 10 == 0:
+            rss.append(rss_mb())
+    gc.callbacks.remove(gc_timer)
+    return nodes, seconds, gc_seconds, rss
+
+def self_play_games(configs, game=_self_play):
+    """
+    game, _self_play by default, for each of configs, each game in a new
+    process, so the memory and garbage collector state of one do not
+    carry over to the next.
+    """
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+    try:
+        return pool.map(game, configs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+def budget_benchmark(args):
+    """
+    Tree nodes and RSS over a game of self-play with args.sims simulations
+    per move, with a budget of args.nodes nodes under each budget policy
+    and without a budget.
+    """
+    budgets = [(args.nodes, 'stop'), (args.nodes, 'prune'), (0, 'stop')]
+    configs = [(args.size, args.sims, args.policy, args.seed, 'objects',
+                {'max_nodes': max_nodes, 'budget_policy': budget_policy})
+               for max_nodes, budget_policy in budgets]
+    for (max_nodes, budget_policy), (nodes, seconds, _, rss) in zip(budgets, self_play_games(configs)):
+        name = "budget {}, {}".format(max_nodes, budget_policy) if max_nodes else "no budget"
+        print("{}: {} moves in {:.1f} seconds, most nodes {}, RSS every 10 moves {} MB".format(
+            name, len(nodes), sum(seconds), max(nodes), ' '.join('{:.0f}'.format(r) for r in rss)))
+
+def latency_benchmark(args):
+    """
+    Per-move search time and garbage collection time over a game of
+    self-play, p50, p99 and max in milliseconds, for each tree store with
+    the garbage collector as is and with MCTS.gc_freeze. Early stop is
+    off, so every move runs args.sims simulations.
+    """
+    runs = [(tree_store, gc_freeze) for tree_store in ('objects', 'arrays')
+            for gc_freeze in (False, True)]
+    configs = [(args.size, args.sims, args.policy, args.seed, tree_store,
+                {'gc_freeze': gc_freeze, 'early_stop': False})
+               for tree_store, gc_freeze in runs]
+    for (tree_store, gc_freeze), (nodes, seconds, gc_seconds, _) in zip(runs, self_play_games(configs)):
+        seconds = np.array(seconds) * 1000
+        gc_seconds = np.array(gc_seconds) * 1000
+        print("{}{}: {} moves, move p50 {:.0f} p99 {:.0f} max {:.0f} ms, "
+              "gc per move p50 {:.1f} p99 {:.1f} max {:.1f} ms".format(
+            tree_store, ", gc_freeze" if gc_freeze else "", len(seconds),
+            np.percentile(seconds, 50), np.percentile(seconds, 99), seconds.max(),
+            np.percentile(gc_seconds, 50), np.percentile(gc_seconds, 99), gc_seconds.max()))
+
+def _rave_game(config):
+    """
+    Play a game between an MCTS with RAVE and one without, both running
+    every search to the same number of playouts and keeping their trees
+    from move to move. config is (size, sims, policy, seed, rave,
+    rave_color). Returns whether the RAVE player won, and the seconds of
+    the searches of the RAVE player and of the other one.
+    """
+    size, sims, policy, random_seed, rave, rave_color = config
+    seed(random_seed)
+    players = {rave_color: MCTS(rave=rave), GoBoardUtilGo4.opponent(rave_color): MCTS()}
+    seconds = {BLACK: 0.0, WHITE: 0.0}
+    for mcts in players.values():
+        mcts.early_stop = False
+    board = SimpleGoBoard(size)
+    while not board.end_of_game() and len(board.moves) < 2 * size * size:
+        color = board.current_player
+        mcts, elapsed = run_search(board, sims, simulation_policy=policy, mcts=players[color])
+        seconds[color] += elapsed
+        tree = mcts.tree
+        move = max(tree.children(tree.root), key=lambda child: tree.get_visits(child[1]))[0]
+        for mcts in players.values():
+            mcts.update_with_move(move)
+        board.move(None if move == 'pass' else move, color)
+    winner, _ = board.score(6.5)
+    return winner == rave_color, seconds[rave_color], seconds[GoBoardUtilGo4.opponent(rave_color)]
+
+def rave_benchmark(args):
+    """
+    Wins of MCTS with RAVE, equivalence args.rave, against plain UCT in
+    args.games games of args.sims simulations per move, taking black and
+    white in turn, and the search seconds of each.
+    """
+    configs = [(args.size, args.sims, args.policy, args.seed + i, args.rave,
+                BLACK if i % 2 == 0 else WHITE) for i in range(args.games)]
+    results = self_play_games(configs, _rave_game)
+    wins = sum(won for won, _, _ in results)
+    print("rave {}: {} of {} games won against plain UCT at {} simulations per move".format(
+        args.rave, wins, len(results), args.sims))
+    print("search seconds: {:.1f} with rave, {:.1f} without".format(
+        sum(r[1] for r in results), sum(r[2] for r in results)))
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--size', type=int, default=7, help='board size')
+    parser.add_argument('--sims', type=int, default=300, help='simulations per search')
+    parser.add_argument('--policy', type=str, default='random', help='simulation policy: random or rulebased')
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
+    parser.add_argument('--workers', type=int, default=16, help='most worker processes for root and tree parallel search, and the rollout pool size for leaf')
+    parser.add_argument('--seconds', type=float, default=5.0, help='seconds per search for tree_parallel')
+    parser.add_argument('--table', type=int, default=1 << 16, help='transposition table size')
+    parser.add_argument('--threshold', type=int, default=2, help='expand_threshold for lazy')
+    parser.add_argument('--widening', type=float, default=1.0, help='widening for lazy')
+    parser.add_argument('--nodes', type=int, default=5000, help='node budget for budget')
+    parser.add_argument('--rave', type=int, default=300, help='RAVE equivalence for rave')
+    parser.add_argument('--games', type=int, default=10, help='games for rave')
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS), help='benchmark to run')
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+BENCHMARKS = {
+    "rewind": rewind_benchmark,
+    "tree": tree_benchmark,
+    "transpositions": transposition_benchmark,
+    "root_parallel": root_parallel_benchmark,
+    "tree_parallel": tree_parallel_benchmark,
+    "leaf": leaf_benchmark,
+    "lazy": lazy_benchmark,
+    "priors": priors_benchmark,
+    "budget": budget_benchmark,
+    "latency": latency_benchmark,
+    "rave": rave_benchmark,
+}
+
+if __name__=='__main__':
+    main()
@@ -41,15 +41,13 @@ class GoBoardUtilGo4(GoBoardUtil):
         assert len(Features_weight) != 0
         moves = []
         gamma_sum = 0.0
-        empty_points = board.get_empty_points()
         color = board.current_player
         probs = np.zeros(board.maxpoint)
         all_board_features = Feature.find_all_features(board)
-        for move in empty_points:
-            if board.check_legal(move, color) and not board.is_eye(move, color):
-                moves.append(move)
-                probs[move] = Feature.compute_move_gamma(Features_weight, all_board_features[move])
-                gamma_sum += probs[move]
+        for move in np.flatnonzero(board.legal_mask(color)).tolist():
+            moves.append(move)
+            probs[move] = Feature.compute_move_gamma(Features_weight, all_board_features[move])
+            gamma_sum += probs[move]
         if len(moves) != 0:
             assert gamma_sum != 0.0
             for m in moves:
@@ -1,8 +1,7 @@
 import numpy as np
 import os,sys
 from board_util import GoBoardUtil, BLACK, WHITE, EMPTY, BORDER, FLOODFILL
-from pattern import pat3set
-from pattern import patIndex
+from pattern import patIndexTable
 
 NUM_SIMPLE_FEATURE = 26
 
@@ -51,6 +50,11 @@ else:
 
 lastBoardRec=[]
 patternWeightRec={}
+# board size -> the tables of move_gammas, see gamma_tables
+gammaTableRec={}
+# the feature of every 3x3 pattern code for each color to play, NO_FEATURE
+# of gamma_tables for codes that are not a pattern
+patternFeatureRec=None
 
 class Feature(object):
 
@@ -102,13 +106,8 @@ class Feature(object):
 
     @staticmethod
     def legal_moves_on_board(board):
-        moves = board.get_empty_points()
-        num_moves = len(moves)
-        legalMoves = []
-        for i in range(num_moves):
-            if board.check_legal(moves[i], board.current_player):
-                legalMoves.append(moves[i])
-        return legalMoves
+        legal = board.legal_mask(board.current_player, exclude_eyes=False)
+        return np.flatnonzero(legal).tolist()
 
     @staticmethod
     def find_all_features(board):
@@ -125,10 +124,8 @@ class Feature(object):
         Feature.find_full_board_features(features, board)
         Feature.find_dist_prev_move_features(features, board, legal_moves)
         Feature.find_line_pos_features(features, board, legal_moves)
-        compare=board.board!=lastBoardRec
-        diff=np.sum(compare)
-        #diffwhere=np.where(compare)
-        if(0 and lastBoardRec!=[] and diff==0):
+        #diffwhere=np.where(board.board!=lastBoardRec)
+        if(0 and len(lastBoardRec) and np.array_equal(board.board, lastBoardRec)):
             for m in legal_moves:
                 if m in patternWeightRec:
                     for f in patternWeightRec[m]:
@@ -180,65 +177,28 @@ class Feature(object):
             else:
                 Feature.set_feature(features, "PASS", FeBasicFeatures["FE_PASS_NEW"])
 
-    @staticmethod
-    def find_self_atari_feature(features, board, point):
-        if GoBoardUtil.selfatari(board, point, board.current_player):
-            Feature.set_feature(features, point, FeBasicFeatures["FE_SELF_ATARI"])
-
     @staticmethod
     def find_pattern_feature(features, board, point):
-        p = board.neighborhood_33(point)
-        if p in pat3set:
-            Feature.set_feature(features, point, patIndex[p]+NUM_SIMPLE_FEATURE,1)
+        index = int(patIndexTable[board.current_player, board.pattern_codes[point]])
+        if index >= 0:
+            Feature.set_feature(features, point, index+NUM_SIMPLE_FEATURE,1)
 
     @staticmethod
     def find_block_anchors(board, limit):
         """
         Find all blocks with liberty less or equal to limit on the board. Anchors is the smallest point in a block.
         Return a list of anchors and corresponding liberties
-        Not efficient. One could maintain all blocks and anchors on the board, and update it when a move is played.
+        Uses the blocks and liberty sets maintained by the board.
         """
         anchors = []
         liberty_dic = {}
-        anchor_dic = {}
-        
-        for x in range(1,board.size+1):
-            for y in range(1,board.size+1):
-                point = board._coord_to_point(x,y)
-                color = board.get_color(point)
-                if point in anchor_dic:
-                    continue
-                if color != WHITE and color != BLACK:
-                    continue
-                liberty = 0
-                the_libs = []
-                group_points = [point]
-                block_points = [point]
-                min_index = point
-                while group_points:
-                    current_point = group_points.pop()
-                    neighbors = board._neighbors(current_point)
-                    for n in neighbors :
-                        if n not in block_points:
-                            if board.get_color(n) == BORDER:
-                                continue
-                            if board.get_color(n) == color:
-                                group_points.append(n)
-                                block_points.append(n)
-                                if n < min_index:
-                                    min_index = n
-                            elif board.get_color(n) == EMPTY:
-                                if n not in the_libs:
-                                    the_libs.append(n)
-                                    liberty += 1
-                    if liberty > limit:
-                        break
-                for p in block_points:
-                    anchor_dic[p] = min_index
-                if liberty <= limit:
-                    anchors.append(min_index)
-                    liberty_dic[min_index] = the_libs
-    
+        for block_anchor, libs in board.block_libs.items():
+            if len(libs) > limit:
+                continue
+            min_index = min(board.block_stones[block_anchor])
+            anchors.append(min_index)
+            liberty_dic[min_index] = sorted(libs)
+        anchors.sort()
         return anchors, liberty_dic
 
     @staticmethod
@@ -336,6 +296,89 @@ class Feature(object):
             Feature.set_feature(features, move, f)
             #print("dist line {}".format(f))
 
+    @staticmethod
+    def gamma_tables(board):
+        """
+        Tables of move_gammas for the board size, built once: the weights
+        with a weight of 1 appended at index NO_FEATURE, and line, prev and
+        own, where line[p] is the FE_LINE feature of point p, and prev[q, p]
+        and own[q, p] the FE_DIST_PREV and FE_DIST_PREV_OWN features of p
+        when q is the last or second last move. A point without one of
+        these features has NO_FEATURE.
+        """
+        global patternFeatureRec
+        tables = gammaTableRec.get(board.size)
+        if tables is not None:
+            return tables
+        no_feature = len(Features_weight)
+        weights = np.append(Features_weight, 1.0)
+        if patternFeatureRec is None:
+            patternFeatureRec = np.where(patIndexTable >= 0,
+                                         patIndexTable + NUM_SIMPLE_FEATURE, no_feature)
+        points = np.where(board.board != BORDER)[0].tolist()
+        line = np.full(board.maxpoint, no_feature, dtype=np.int64)
+        prev = np.full((board.maxpoint, board.maxpoint), no_feature, dtype=np.int64)
+        own = np.full((board.maxpoint, board.maxpoint), no_feature, dtype=np.int64)
+        for p in points:
+            line[p] = Feature.compute_feature("FE_LINE_1", 1, min(3, Feature.distance_to_line(board, p)))
+            for q in points:
+                d = Feature.distance(board, p, q)
+                if d == 0:
+                    own[q, p] = FeBasicFeatures["FE_DIST_PREV_OWN_0"]
+                elif d <= 9:
+                    prev[q, p] = Feature.compute_feature("FE_DIST_PREV_2", 2, d)
+                    own[q, p] = Feature.compute_feature("FE_DIST_PREV_OWN_2", 2, d)
+        tables = (weights, line, prev, own)
+        gammaTableRec[board.size] = tables
+        return tables
+
+    @staticmethod
+    def move_gammas(board, moves):
+        """
+        Gammas of the legal moves in the sorted array moves and of PASS, as
+        an array with the gamma of PASS last. It gives the same gammas as
+        compute_move_gamma over find_all_features, but is computed for
+        all moves at once from gamma_tables, with the weights multiplied
+        in the same order as the features are found.
+        """
+        weights, line, prev, own = Feature.gamma_tables(board)
+        gammas = np.ones(len(moves) + 1)
+        if len(board.moves) == 0 or board.last_move != None:
+            gammas[-1] = weights[FeBasicFeatures["FE_PASS_NEW"]]
+        else:
+            gammas[-1] = weights[FeBasicFeatures["FE_PASS_CONSECUTIVE"]]
+        # capture and atari features of the liberties of opponent blocks
+        # with one or two liberties, in the order of find_full_board_features
+        opp = GoBoardUtil.opponent(board.current_player)
+        found = []
+        for anchor, libs in board.block_libs.items():
+            if len(libs) <= 2 and board.board[anchor] == opp:
+                found.append((min(board.block_stones[anchor]), sorted(libs)))
+        if found:
+            found.sort()
+            seen = set()
+            for _, libs in found:
+                if len(libs) == 1:
+                    f = FeBasicFeatures["FE_CAPTURE"]
+                elif board.ko_constraint != None:
+                    f = FeBasicFeatures["FE_ATARI_KO"]
+                else:
+                    f = FeBasicFeatures["FE_ATARI_OTHER"]
+                for l in libs:
+                    i = int(np.searchsorted(moves, l))
+                    if i < len(moves) and moves[i] == l and (l, f) not in seen:
+                        seen.add((l, f))
+                        gammas[i] *= weights[f]
+        g = gammas[:-1]
+        if board.last_move != None:
+            g *= weights[prev[board.last_move, moves]]
+        if board.last2_move != None:
+            g *= weights[own[board.last2_move, moves]]
+        g *= weights[line[moves]]
+        codes = np.array(board.pattern_codes)[moves]
+        g *= weights[patternFeatureRec[board.current_player, codes]]
+        return gammas
+
     @staticmethod
     def compute_move_gamma(features_weight, features):
         gamma = 1.0
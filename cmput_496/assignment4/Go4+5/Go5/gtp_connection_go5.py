@@ -12,7 +12,7 @@ sys.path.append(utilpath)
 utilpath = sys.path[0] + "/../util/"
 sys.path.append(utilpath)
 from gtp_connection import GtpConnection
-from board_util_go4 import GoBoardUtilGo4
+from board_util_go4 import GoBoardUtilGo4, BLACK, WHITE
 import numpy as np
 import re
 
@@ -36,6 +36,127 @@ class GtpConnectionGo5(GtpConnection):
         self.commands["genmove"] = self.genmove_cmd
         self.argmap["prior_knowledge"] = (0, 'Usage: prior_knowledge')
         self.argmap["genmove"] = (1, 'Usage: genmove {w,b}')
+        self.commands["play"] = self.play_cmd
+        self.commands["time_settings"] = self.time_settings_cmd
+        self.commands["time_left"] = self.time_left_cmd
+        self.commands["genmove_time"] = self.genmove_time_cmd
+        self.commands["leaf_rollouts"] = self.leaf_rollouts_cmd
+        self.argmap["time_settings"] = (3, 'Usage: time_settings MAIN_TIME BYO_YOMI_TIME BYO_YOMI_STONES')
+        self.argmap["time_left"] = (3, 'Usage: time_left {w,b} TIME STONES')
+        self.argmap["genmove_time"] = (1, 'Usage: genmove_time SECONDS (0 for no fixed time per move)')
+        self.argmap["leaf_rollouts"] = (1, 'Usage: leaf_rollouts INT (rollouts from each leaf of the search)')
+
+    def start_connection(self):
+        """
+        Like GtpConnection.start_connection, but lets the engine ponder
+        while waiting for each command.
+        """
+        self.debug_msg("Start up successful...\n\n")
+        line = sys.stdin.readline()
+        while line:
+            self.get_cmd(line)
+            self.go_engine.start_pondering(self.board)
+            line = sys.stdin.readline()
+            self.go_engine.stop_pondering()
+
+    def play_cmd(self, args):
+        """
+        GtpConnection.play_cmd, and then the engine follows the move
+        in its search tree.
+        """
+        num_moves = len(self.board.moves)
+        GtpConnection.play_cmd(self, args)
+        if len(self.board.moves) > num_moves:
+            color = GoBoardUtilGo4.opponent(self.board.current_player)
+            self.go_engine.play(self.board.moves[-1], color)
+
+    def leaf_rollouts_cmd(self, args):
+        """
+        Set the number of rollouts played from each leaf of the MCTS
+        search and backed up together, 1 by default.
+        """
+        try:
+            value = int(args[0])
+        except ValueError:
+            value = 0
+        if value < 1:
+            self.error('Argument ({}) must be a positive integer'.format(args[0]))
+            return
+        self.go_engine.leaf_rollouts = value
+        self.respond()
+
+    def mcts_info_cmd(self, args):
+        """
+        mcts_info of GtpConnection, after a line on the size of the
+        current tree and its node budget.
+        """
+        sys.stderr.write('{}\n'.format(self.go_engine.MCTS.budget_info()))
+        sys.stderr.flush()
+        GtpConnection.mcts_info_cmd(self, args)
+
+    def time_settings_cmd(self, args):
+        """
+        Set the time control of the game.
+
+        Arguments
+        ---------
+        args[0] : int
+            main time in seconds
+        args[1] : int
+            byo-yomi time in seconds
+        args[2] : int
+            stones to play in each byo-yomi period
+        """
+        try:
+            main_time, byo_yomi_time, byo_yomi_stones = [int(arg) for arg in args[:3]]
+        except ValueError:
+            self.error('time_settings takes three integers')
+            return
+        if main_time < 0 or byo_yomi_time < 0 or byo_yomi_stones < 0:
+            self.error('time settings must not be negative')
+            return
+        self.go_engine.time_manager.set_time_settings(main_time, byo_yomi_time, byo_yomi_stones)
+        self.respond()
+
+    def time_left_cmd(self, args):
+        """
+        Tell the engine the time left of a player.
+
+        Arguments
+        ---------
+        args[0] : {'b','w'}
+            the color of the player
+        args[1] : int
+            seconds left
+        args[2] : int
+            stones left in the byo-yomi period, 0 in main time
+        """
+        try:
+            color = GoBoardUtilGo4.color_to_int(args[0].lower())
+            seconds, stones = int(args[1]), int(args[2])
+        except ValueError:
+            color = None
+        if color not in (BLACK, WHITE):
+            self.error(self.argmap["time_left"][1])
+            return
+        self.go_engine.time_manager.set_time_left(color, seconds, stones)
+        self.respond()
+
+    def genmove_time_cmd(self, args):
+        """
+        Search every move for a fixed number of seconds, which takes
+        precedence over time_settings. 0 turns it off.
+        """
+        try:
+            seconds = float(args[0])
+        except ValueError:
+            self.error('Argument ({}) must be a number of seconds'.format(args[0]))
+            return
+        if seconds < 0:
+            self.error('Argument ({}) must not be negative'.format(args[0]))
+            return
+        self.go_engine.time_manager.move_time = seconds if seconds > 0 else None
+        self.respond()
 
 
     def prior_knowledge_cmd(self,args):
@@ -3,12 +3,19 @@
 This function is loosely based on https://github.com/Rochester-NRT/RocAlphaGo/blob/develop/AlphaGo/mcts.py
 """
 import os, sys
+import gc
 import numpy as np
-from gtp_connection_go5 import GtpConnectionGo5
 
 import random
+import time
+import multiprocessing
 from board_util_go4 import GoBoardUtilGo4, BLACK, WHITE
-PASS = 'pass'
+from array_tree import ArrayTree, PASS, PASS_POINT, uct_argmax, rave_argmax
+from transposition import TranspositionTable
+from feature import Feature
+
+# most positions kept in an MCTS prior_cache, see expansion
+PRIOR_CACHE_SIZE = 1 << 13
 
 def uct_val(node, child, exploration, max_flag):
     if child._n_visits == 0:
@@ -18,18 +25,120 @@ def uct_val(node, child, exploration, max_flag):
     else:
         return float(child._n_visits - child._black_wins)/child._n_visits + exploration*np.sqrt(np.log(node._n_visits)/child._n_visits)
 
+def expansion(board, color, in_tree_knowledge, prior_cache=None):
+    """
+    The children of a node expanded in the position on board with color to
+    play: the legal moves that do not fill an eye of color, then PASS.
+    Returns (moves, visits, black_wins), where visits and black_wins are
+    the initial statistics of the children from in-tree knowledge, or None.
+
+    The probabilistic prior of a move is the visits GtpConnectionGo5.sim
+    gives it, 10 * gamma / largest gamma, rounded, with no wins. The
+    gammas come from Feature.move_gammas in one pass over the board.
+    With a prior_cache dict, the children of a position are kept and
+    reused when it is expanded again; they must not be modified.
+    """
+    if in_tree_knowledge != 'probabilistic':
+        moves = np.flatnonzero(board.legal_mask(color)).tolist()
+        moves.append(PASS)
+        return moves, None, None
+    if prior_cache is not None:
+        # the features also depend on the last two moves; the empty board
+        # hashes to 0 on every board size
+        key = (board.size, board.position_hash, board.last_move, board.last2_move,
+               len(board.moves) == 0)
+        children = prior_cache.get(key)
+        if children is not None:
+            return children
+    points = np.flatnonzero(board.legal_mask(color))
+    gammas = Feature.move_gammas(board, points)
+    visits = np.rint(10 * gammas / gammas.max()).astype(np.int64).tolist()
+    moves = points.tolist()
+    moves.append(PASS)
+    children = (moves, visits, [0] * len(moves))
+    if prior_cache is not None:
+        if len(prior_cache) >= PRIOR_CACHE_SIZE:
+            prior_cache.clear()
+        prior_cache[key] = children
+    return children
+
+def prior_order(moves, visits, black_wins):
+    """
+    The children from expansion in the order progressive widening adds
+    them: by prior visits, most first, or without in-tree knowledge the
+    board moves in random order and then PASS.
+    """
+    if visits is None:
+        moves = moves[:-1]
+        random.shuffle(moves)
+        moves.append(PASS)
+        return moves, None, None
+    order = sorted(range(len(moves)), key=lambda i: -visits[i])
+    return ([moves[i] for i in order], [visits[i] for i in order],
+            [black_wins[i] for i in order])
+
+def rollout_black_wins(board, color, n, komi, limit, simulation_policy, use_pattern, check_selfatari):
+    """
+    Play n rollouts from the position on board with color to play and
+    return how many black won. board is left at the end of the last one.
+    """
+    leaf = board.copy() if n > 1 else None
+    black_wins = 0
+    for i in range(n):
+        if i:
+            leaf.copy_into(board)
+        winner = GoBoardUtilGo4.playGame(board,
+                color,
+                komi=komi,
+                limit=limit,
+                simulation_policy=simulation_policy,
+                use_pattern=use_pattern,
+                check_selfatari=check_selfatari)
+        if winner == BLACK:
+            black_wins += 1
+    return black_wins
+
+def _pool_rollouts(args):
+    return rollout_black_wins(*args)
+
+def _seed_rollout_worker():
+    seed = (os.getpid() * 1000003 + int(time.time() * 1000)) % (1 << 30)
+    random.seed(seed)
+    np.random.seed(seed)
+
+def rollout_pool(num_workers):
+    """
+    Process pool for the leaf rollouts of MCTS, see MCTS.rollout_pool.
+    """
+    return multiprocessing.Pool(num_workers, initializer=_seed_rollout_worker)
+
 class TreeNode(object):
     """
     A node in the MCTS tree.
+    A node holds no reference to its parent, so the tree has no reference
+    cycles: a subtree that is dropped is freed right away, without waiting
+    for the cyclic garbage collector.
     """
     version = 0.22
     name = "MCTS Player"
-    def __init__(self, parent):
-        """
-        parent is set when a node gets expanded
-        """
-        self._parent = parent
+    def __init__(self):
         self._children = {}  # a map from move to TreeNode
+        # the children in order, with their visits and black wins in
+        # contiguous arrays for select; _index is the position of a node
+        # among the children of its parent
+        self._child_nodes = None
+        self._child_visits = None
+        self._child_black_wins = None
+        self._index = None
+        # in a tree with AMAF statistics, the points of the moves of the
+        # children, PASS_POINT for PASS, and their AMAF visits and black
+        # wins, see update_amaf
+        self._child_points = None
+        self._child_amaf_visits = None
+        self._child_amaf_black_wins = None
+        # (moves, visits, black_wins) of the children not added yet under
+        # progressive widening, see widen
+        self._pending = None
         self._n_visits = 0
         self._black_wins = 0
         self._expanded = False
@@ -39,115 +148,149 @@ class TreeNode(object):
         """
         Expands tree by creating new children.
         """
+        moves, visits, black_wins = expansion(board, color, in_tree_knowledge)
+        self.add_children(moves, visits, black_wins)
+
+    def add_children(self, moves, visits=None, black_wins=None, width=None, amaf=False):
+        """
+        Create a child for each of the moves, with the given initial
+        visits and black wins. With width, only the first width moves get
+        a child now and the rest wait for widen. With amaf, the children
+        also get AMAF statistics.
+        """
+        self._child_nodes = []
+        if width is not None and width < len(moves):
+            self._pending = (moves[width:],
+                             None if visits is None else visits[width:],
+                             None if black_wins is None else black_wins[width:])
+            moves = moves[:width]
+            if visits is not None:
+                visits = visits[:width]
+                black_wins = black_wins[:width]
+        self._child_visits, self._child_black_wins = self._new_children(moves, visits, black_wins)
+        if amaf:
+            self._child_points = self._points(moves)
+            self._child_amaf_visits = np.zeros((len(moves)),dtype=np.int64)
+            self._child_amaf_black_wins = np.zeros((len(moves)),dtype=np.int64)
+        self._expanded = True
+
+    @staticmethod
+    def _points(moves):
+        return np.array([PASS_POINT if move == PASS else move for move in moves],dtype=np.int64)
 
-        if in_tree_knowledge == 'probabilistic':
-            #initialize it to values
-            move, prob = GtpConnectionGo5.probability(self, board)
-
-            sim_probs = GtpConnectionGo5.sim(self, prob, move, board)
-            # print(sim_prob)
-            win_rate = GtpConnectionGo5.winrates(self, prob, move, board)
-
-            # wins = np.zeros(board.maxpoint)
-            wins = np.zeros(board.maxpoint)
-
-            for elem in move:
-            	# print(GoBoardUtilGo4.format_point(self.board._point_to_coord(elem)), sim_probs[elem], win_rate[elem])
-            	wins[elem] = int(round(sim_probs[elem] * wins[elem]))
-            	# after calculating wins, we need to round simulation
-            	sim_probs[elem] = int(round(sim_probs[elem]))
-            values = []
-            for elem in move:
-            	values2 = []
-            	elem2 = elem
-            	if elem == 0:
-            		elem2 = 'Pass'
-            		values2.append(elem2)
-            		values2.append(int(wins[elem]))
-            		values2.append(int(sim_probs[elem]))
-            		values2.append(win_rate[elem])
-            		values.append(values2)
-            	else:
-            		# values2.append(GoBoardUtilGo4.format_point(board._point_to_coord(elem)))
-            		values2.append((elem))
-            		values2.append(int(wins[elem]))
-            		values2.append(int(sim_probs[elem]))
-            		values2.append(win_rate[elem])
-            		values.append(values2)
-
-            values4 = sorted(values, key = lambda x:(-x[3],-x[2], x[0]))
-            
-            # print("~~~~~~~~~~~~~~~~~~~~~",values4)
-
-            moves = board.get_empty_points()
-            for move in moves:
-            	# print(move)
-            	if move not in self._children:
-                    if board.check_legal(move, color) and not board.is_eye(move, color):
-                        self._children[move] = TreeNode(self)
-                        self._children[move]._move = move
-                        # print(values4)
-                        for elem in values4:
-                        	# print(elem)
-                        	# print(move, elem[0])
-                        	if move == elem[0]:
-                        		# print(move, elem[0])
-                        		self._children[move]._black_wins = elem[1]
-                        		self._children[move]._n_visits = elem[2]
-            self._children[PASS] = TreeNode(self)
-            self._children[PASS]._move = PASS
-            self._expanded = True
-            for elem in values4:
-                if elem[0] =='Pass':
-                	self._children[PASS]._black_wins = elem[1]
-                	self._children[PASS]._n_visits = elem[2]
+    def _new_children(self, moves, visits, black_wins):
+        """
+        Append a child for each of the moves and return the arrays of
+        their visits and black wins.
+        """
+        first = len(self._child_nodes)
+        for i, move in enumerate(moves):
+            child = TreeNode()
+            child._move = move
+            child._index = first + i
+            if visits is not None:
+                child._n_visits = visits[i]
+                child._black_wins = black_wins[i]
+            self._children[move] = child
+            self._child_nodes.append(child)
+        if visits is None:
+            return (np.zeros((len(moves)),dtype=np.int64),
+                    np.zeros((len(moves)),dtype=np.int64))
+        return np.array(visits,dtype=np.int64), np.array(black_wins,dtype=np.int64)
 
+    def widen(self, width):
+        """
+        Add pending children until there are width children.
+        Returns the number of children added.
+        """
+        n = width - len(self._child_nodes)
+        if self._pending is None or n <= 0:
+            return 0
+        moves, visits, black_wins = self._pending
+        if visits is None:
+            new_visits, new_black_wins = self._new_children(moves[:n], None, None)
         else:
-            moves = board.get_empty_points()
-            for move in moves:
-                if move not in self._children:
-                    if board.check_legal(move, color) and not board.is_eye(move, color):
-                        self._children[move] = TreeNode(self)
-                        self._children[move]._move = move
-            self._children[PASS] = TreeNode(self)
-            self._children[PASS]._move = PASS
-            self._expanded = True
-
-    def select(self, exploration, max_flag):
+            new_visits, new_black_wins = self._new_children(moves[:n], visits[:n], black_wins[:n])
+            visits = visits[n:]
+            black_wins = black_wins[n:]
+        self._child_visits = np.concatenate((self._child_visits, new_visits))
+        self._child_black_wins = np.concatenate((self._child_black_wins, new_black_wins))
+        if self._child_points is not None:
+            zeros = np.zeros((len(new_visits)),dtype=np.int64)
+            self._child_points = np.concatenate((self._child_points, self._points(moves[:n])))
+            self._child_amaf_visits = np.concatenate((self._child_amaf_visits, zeros))
+            self._child_amaf_black_wins = np.concatenate((self._child_amaf_black_wins, zeros))
+        self._pending = (moves[n:], visits, black_wins) if len(moves) > n else None
+        return len(new_visits)
+
+    def select(self, exploration, max_flag, rave=0):
         """
         Select move among children that gives maximizes UCT.
         If number of visits are zero for a node, value for that node is infinite, so definitely will get selected
 
         It uses: argmax(child_num_black_wins/child_num_vists + C * sqrt(2 * ln * Parent_num_vists/child_num_visits) )
+        computed for all children at once by uct_argmax.
+        With rave > 0 and AMAF statistics, the win rate of a child is
+        blended with its AMAF win rate, see rave_argmax.
         Returns:
         A tuple of (move, next_node)
         """
-        return max(self._children.items(), key=lambda items:uct_val(self, items[1], exploration, max_flag))
+        if rave and self._child_amaf_visits is not None:
+            best = rave_argmax(self._child_visits, self._child_black_wins,
+                               self._child_amaf_visits, self._child_amaf_black_wins,
+                               self._n_visits, exploration, max_flag, rave)
+        else:
+            best = uct_argmax(self._child_visits, self._child_black_wins,
+                              self._n_visits, exploration, max_flag)
+        child = self._child_nodes[best]
+        return child._move, child
 
 
-    def update(self, leaf_value):
+    def update(self, leaf_value, n=1, parent=None):
         """
         Update node values from leaf evaluation.
         Arguments:
-        leaf_value -- the value of subtree evaluation from the current player's perspective.
+        leaf_value -- the number of black wins among the n leaf evaluations.
+        n -- the number of leaf evaluations.
+        parent -- the node this one was reached from, whose arrays of
+        child statistics are updated too; None for the root.
 
         Returns:
         None
         """
         self._black_wins += leaf_value
-        self._n_visits += 1
+        self._n_visits += n
+        if parent is not None:
+            parent._child_visits[self._index] += n
+            parent._child_black_wins[self._index] += leaf_value
 
-    def update_recursive(self, leaf_value):
+    def update_amaf(self, played, depth, leaf_value):
+        """
+        Count a playout of leaf_value black wins in the AMAF statistics of
+        the children whose move the player to play at this node, at depth
+        in the playout, played at that depth or later. played is the array
+        by point of the last depth each point was played by that player,
+        see MCTS._amaf_played.
         """
-        Like a call to update(), but applied recursively for all ancestors.
+        counted = played[self._child_points] >= depth
+        self._child_amaf_visits += counted
+        if leaf_value:
+            self._child_amaf_black_wins += counted
 
-        Note: it is important that this happens from the root downward so that 'parent' visit
-        counts are correct.
+    def remove_children(self):
         """
-        # If it is not root, this node's parent should be updated first.
-        if self._parent:
-            self._parent.update_recursive(leaf_value)
-        self.update(leaf_value)
+        Make the node a leaf again, dropping its subtree. Its own
+        statistics are kept.
+        """
+        self._children = {}
+        self._child_nodes = None
+        self._child_visits = None
+        self._child_black_wins = None
+        self._child_points = None
+        self._child_amaf_visits = None
+        self._child_amaf_black_wins = None
+        self._pending = None
+        self._expanded = False
 
 
     def is_leaf(self):
@@ -157,19 +300,334 @@ class TreeNode(object):
         return self._children == {}
 
     def is_root(self):
-        return self._parent is None
+        return self._index is None
 
 
 
+class NodeTree(object):
+    """
+    Tree store for MCTS made of TreeNode objects, a node is the TreeNode
+    itself. ArrayTree in array_tree.py has the same interface.
+    """
+    # about the memory of a node with its share of the child arrays,
+    # measured with benchmark.py tree
+    bytes_per_node = 290
+
+    def __init__(self, root=None, amaf=False):
+        if root is None:
+            root = TreeNode()
+        self.root = root
+        # whether expanded nodes get AMAF statistics, see backup_amaf
+        self.amaf = amaf
+        self._num_nodes = None if root._expanded else 1
+
+    def num_nodes(self):
+        if self._num_nodes is None:
+            # children shared through the transposition table are counted once
+            seen = set()
+            stack = [self.root]
+            while stack:
+                node = stack.pop()
+                if id(node) in seen:
+                    continue
+                seen.add(id(node))
+                stack.extend(node._children.values())
+            self._num_nodes = len(seen)
+        return self._num_nodes
+
+    def expanded(self, node):
+        return node._expanded
+
+    def expand(self, node, moves, visits=None, black_wins=None, width=None):
+        node.add_children(moves, visits, black_wins, width, self.amaf)
+        if self._num_nodes is not None:
+            self._num_nodes += len(node._child_nodes)
+
+    def widen(self, node, width):
+        """
+        Make the first width moves of the expanded node its children,
+        see expand.
+        """
+        added = node.widen(width)
+        if added and self._num_nodes is not None:
+            self._num_nodes += added
+
+    def share(self, node, other):
+        """
+        Make the children of the expanded node other the children of node too.
+        """
+        node._children = other._children
+        node._child_nodes = other._child_nodes
+        node._child_visits = other._child_visits
+        node._child_black_wins = other._child_black_wins
+        node._child_points = other._child_points
+        node._child_amaf_visits = other._child_amaf_visits
+        node._child_amaf_black_wins = other._child_amaf_black_wins
+        node._expanded = True
+
+    def children(self, node):
+        return list(node._children.items())
+
+    def child_visits(self, node):
+        """
+        Array of the visits of the children of node.
+        """
+        if not node._expanded:
+            return np.zeros((0),dtype=np.int64)
+        return node._child_visits
+
+    def get_move(self, node):
+        return node._move
+
+    def get_visits(self, node):
+        return node._n_visits
+
+    def get_black_wins(self, node):
+        return node._black_wins
+
+    def uct_value(self, node, child, exploration, max_flag):
+        return uct_val(node, child, exploration, max_flag)
+
+    def select(self, node, exploration, max_flag, rave=0):
+        return node.select(exploration, max_flag, rave)
+
+    def backup(self, path, leaf_value, n=1):
+        """
+        Update the nodes on path, from the root to the leaf, with
+        leaf_value black wins out of n leaf evaluations.
+        """
+        parent = None
+        for node in path:
+            node.update(leaf_value, n, parent)
+            parent = node
+
+    def backup_batch(self, paths, leaf_values):
+        """
+        Back up several leaf evaluations, one per path.
+        """
+        for path, leaf_value in zip(paths, leaf_values):
+            self.backup(path, leaf_value)
+
+    def backup_amaf(self, path, played, leaf_value):
+        """
+        Update the AMAF statistics of the children of the expanded nodes
+        on path with the playout of leaf_value black wins, see
+        TreeNode.update_amaf.
+        """
+        for depth, node in enumerate(path):
+            if node._expanded:
+                node.update_amaf(played[depth % 2], depth, leaf_value)
+
+    def subtree(self, move):
+        """
+        Return a NodeTree of the subtree below the root child for move,
+        or an empty tree if the root has no such child.
+        """
+        child = self.root._children.get(move)
+        if child is None:
+            return NodeTree(amaf=self.amaf)
+        child._index = None
+        return NodeTree(child, self.amaf)
+
+    def nodes_at_depth(self, max_depth):
+        """
+        Number of expanded nodes at each depth below the root.
+        """
+        counts = [0] * max_depth
+        level = [self.root]
+        for depth in range(max_depth):
+            # dict keeps each shared node once, in order
+            level = list({id(node): node for node in level if node._expanded}.values())
+            if not level:
+                break
+            counts[depth] = len(level)
+            level = [child for node in level for child in node._children.values()]
+        return counts
+
+    def _expanded_nodes(self):
+        # each shared node once
+        nodes = {}
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node._expanded and id(node) not in nodes:
+                nodes[id(node)] = node
+                stack.extend(node._child_nodes)
+        return list(nodes.values())
+
+    def expansions(self):
+        """
+        Arrays of the visits and of the number of children of the expanded
+        nodes, the root first.
+        """
+        nodes = self._expanded_nodes()
+        return (np.array([node._n_visits for node in nodes], dtype=np.int64),
+                np.array([len(node._child_nodes) for node in nodes], dtype=np.int64))
+
+    def pruned(self, min_visits):
+        """
+        Make leaves of the expanded nodes below the root with fewer than
+        min_visits visits, dropping their subtrees, and return the tree.
+        """
+        for node in self._expanded_nodes():
+            if node is not self.root and node._n_visits < min_visits:
+                node.remove_children()
+        self._num_nodes = None
+        return self
+
 class MCTS(object):
-    def __init__(self):
-        self._root = TreeNode(None)
+    # the part of max_nodes a prune brings the tree down to
+    PRUNE_TO = 0.75
+
+    def __init__(self, tree_store='objects', transpositions=0, rave=0):
+        # 'objects' keeps the tree as TreeNode objects, 'arrays' in the
+        # numpy arrays of an ArrayTree
+        self.tree_store = tree_store
+        # with rave > 0, every playout also updates the AMAF (all moves as
+        # first) statistics of the children of the nodes on its path, and
+        # select blends them into the value of a child, see rave_argmax:
+        # rave is the number of visits at which the own and AMAF win
+        # rates of a child weigh about the same. Only playouts of one
+        # rollout update the AMAF statistics.
+        self.rave = rave
+        self.tree = self._new_tree()
+        # with transpositions > 0, a leaf whose position is already expanded
+        # elsewhere in the tree shares the children of that node, looked
+        # up in a table of that many entries
+        self.table = TranspositionTable(transpositions) if transpositions > 0 else None
+        # children with probabilistic priors of positions expanded before,
+        # see expansion; they depend on the position only, so they are
+        # kept from move to move, until reset
+        self.prior_cache = {}
         self.toplay = BLACK
+        # how the board is brought back to the root position after a playout:
+        # 'snapshot' restores one simulation board from the root position
+        # with copy_into, 'undo' rewinds it with undo_to, 'copy' plays
+        # every playout on a new copy of the board
+        self.rewind = 'snapshot'
+        # every check_interval playouts the search checks whether it is
+        # out of time and, with early_stop, whether the most visited root
+        # child can still be overtaken in the playouts left
+        self.check_interval = 10
+        self.early_stop = True
+        # playouts and seconds of the last get_move, and the playouts or
+        # seconds it saved by stopping early
+        self.num_playouts = 0
+        self.search_time = 0.0
+        self.playouts_saved = 0
+        self.seconds_saved = 0.0
+        # rollouts from each leaf, backed up together; with a rollout_pool
+        # of rollout_workers processes they are shared out among them
+        self.leaf_rollouts = 1
+        self.rollout_pool = None
+        self.rollout_workers = 0
+        # a leaf is only expanded once it has expand_threshold visits,
+        # prior visits included; until then its playouts roll out from it
+        self.expand_threshold = 0
+        # progressive widening: with widening > 0, a node with n visits has
+        # as children only the first widening * n ** widening_exponent
+        # moves, at least one, in the order of prior_order
+        self.widening = 0.0
+        self.widening_exponent = 0.5
+        # node budget: with max_nodes > 0 the tree is kept to about
+        # max_nodes nodes. With budget_policy 'stop', leaves are no longer
+        # expanded once the tree has max_nodes nodes and the playouts roll
+        # out from them; with 'prune', the subtrees of the least visited
+        # nodes are dropped, see _prune
+        self.max_nodes = 0
+        self.budget_policy = 'stop'
+        self.prunes = 0
+        self.pruned_nodes = 0
+        # with gc_freeze, the cyclic garbage collector is off during
+        # search, and the objects alive after it, the tree among them, are
+        # moved to the permanent generation with gc.freeze, so later
+        # collections do not scan them again. The tree has no reference
+        # cycles, so it is still freed when dropped. Each search first
+        # unfreezes what the last one froze, so the permanent generation
+        # does not grow over the game and cyclic garbage in it can still
+        # be collected; the young garbage made between searches is then
+        # collected, so it is not frozen. Both act on the whole process,
+        # so objects of the caller are frozen along with the tree.
+        self.gc_freeze = False
+
+    def _new_tree(self):
+        if self.tree_store == 'arrays':
+            return ArrayTree(amaf=self.rave > 0)
+        return NodeTree(amaf=self.rave > 0)
+
+    @property
+    def _root(self):
+        return self.tree.root
+
+    def _expand(self, node, board, color, in_tree_knowledge):
+        if (self.max_nodes and self.budget_policy == 'stop' and node != self.tree.root
+                and self.tree.num_nodes() >= self.max_nodes):
+            return
+        if self.table is not None:
+            key = TranspositionTable.key(board)
+            other = self.table.lookup(key)
+            if other is not None and other != node:
+                self.tree.share(node, other)
+                return
+        moves, visits, black_wins = expansion(board, color, in_tree_knowledge, self.prior_cache)
+        if self.widening > 0:
+            moves, visits, black_wins = prior_order(moves, visits, black_wins)
+            self.tree.expand(node, moves, visits, black_wins,
+                             self._width(self.tree.get_visits(node)))
+        else:
+            self.tree.expand(node, moves, visits, black_wins)
+        if self.table is not None:
+            self.table.store(key, node)
+
+    def _check_budget(self):
+        """
+        Prune the tree if it has grown past max_nodes, between playouts.
+        """
+        if self.max_nodes and self.budget_policy == 'prune' and self.tree.num_nodes() > self.max_nodes:
+            self._prune()
+
+    def _prune(self):
+        """
+        Bring the tree down to about PRUNE_TO * max_nodes nodes by making
+        leaves of the expanded nodes with fewer visits than a threshold.
+        The threshold keeps the most visited expanded nodes whose children
+        fit in that many nodes.
+        """
+        before = self.tree.num_nodes()
+        visits, num_children = self.tree.expansions()
+        order = np.argsort(-visits, kind='stable')
+        kept = 1 + np.cumsum(num_children[order])
+        fit = int(np.searchsorted(kept, self.PRUNE_TO * self.max_nodes, side='right'))
+        if fit >= len(order):
+            return
+        self.tree = self.tree.pruned(visits[order[fit]] + 1)
+        # the table refers to nodes that may be gone
+        if self.table is not None:
+            self.table.clear()
+        self.prunes += 1
+        self.pruned_nodes += before - self.tree.num_nodes()
+
+    def budget_info(self):
+        """
+        One line on the size of the tree and the node budget.
+        """
+        if not self.max_nodes:
+            return "Nodes: {}, no node budget".format(self.tree.num_nodes())
+        return "Nodes: {} of a budget of {}, policy {}, {} prunes dropped {} nodes".format(
+            self.tree.num_nodes(), self.max_nodes, self.budget_policy, self.prunes, self.pruned_nodes)
+
+    def _width(self, visits):
+        """
+        The number of children of a node with visits visits under
+        progressive widening.
+        """
+        return max(1, int(self.widening * visits ** self.widening_exponent))
+
     def _playout(self, board, color, in_tree_knowledge):
         """
         Run a single playout from the root to the given depth, getting a value at the leaf and
         propagating it back through its parents. State is modified in-place, so a copy must be
-        provided.
+        provided, or the board must be rewound afterwards (see _search).
 
         Arguments:
         board -- a copy of the board.
@@ -179,14 +637,21 @@ class MCTS(object):
         Returns:
         None
         """
-        node = self._root
+        tree = self.tree
+        node = tree.root
+        # the nodes from the root down to the leaf, for the backup
+        path = [node]
+        # the moves of the playout are the moves on board from here on
+        start = len(board.moves)
         # This will be True only once for the root
-        if not node._expanded:
-            node.expand(board, color, in_tree_knowledge)
-        while not node.is_leaf():
+        if not tree.expanded(node):
+            self._expand(node, board, color, in_tree_knowledge)
+        while tree.expanded(node):
+            if self.widening > 0:
+                tree.widen(node, self._width(tree.get_visits(node)))
             # Greedily select next move.
             max_flag = color == BLACK
-            move, next_node = node.select(self.exploration,max_flag)
+            move, next_node = tree.select(node, self.exploration, max_flag, self.rave)
             if move!=PASS:
                 assert board.check_legal(move, color)
             if move == PASS:
@@ -194,14 +659,36 @@ class MCTS(object):
             board.move(move, color)
             color = GoBoardUtilGo4.opponent(color)
             node = next_node
-        assert node.is_leaf()
-        if not node._expanded:
-            node.expand(board, color, in_tree_knowledge)
+            path.append(node)
+        if tree.get_visits(node) >= self.expand_threshold:
+            self._expand(node, board, color, in_tree_knowledge)
 
         assert board.current_player == color
+        if self.leaf_rollouts > 1:
+            # Update value and visit count of nodes in this traversal.
+            tree.backup(path, self._evaluate_rollouts(board, color, self.leaf_rollouts),
+                        self.leaf_rollouts)
+            return
         leaf_value = self._evaluate_rollout(board, color)
         # Update value and visit count of nodes in this traversal.
-        node.update_recursive(leaf_value)
+        tree.backup(path, leaf_value)
+        if self.rave:
+            tree.backup_amaf(path, self._amaf_played(board, start), leaf_value)
+
+    @staticmethod
+    def _amaf_played(board, start):
+        """
+        The moves of a playout, the moves on board from the one numbered
+        start on, for backup_amaf: a pair of arrays by point, where
+        played[d % 2][point] is the last depth d in the playout, counted
+        from 0 at start, at which point was played, or -1. Passes are
+        left out.
+        """
+        played = np.full((2, board.maxpoint), -1, dtype=np.int64)
+        for depth, point in enumerate(board.moves[start:]):
+            if point is not None:
+                played[depth % 2, point] = depth
+        return played
 
     def _evaluate_rollout(self, board, toplay):
         """
@@ -220,7 +707,104 @@ class MCTS(object):
         else:
             return 0
 
-    def get_move(self,
+    def _evaluate_rollouts(self, board, toplay, n):
+        """
+        The number of black wins in n rollouts from the position on board,
+        played in this process or in rollout_pool.
+        """
+        settings = (self.komi, self.limit, self.simulation_policy,
+                    self.use_pattern, self.check_selfatari)
+        if self.rollout_pool is None:
+            return rollout_black_wins(board, toplay, n, *settings)
+        # one task per worker, so the board is sent to each only once
+        tasks = min(n, self.rollout_workers)
+        share, extra = divmod(n, tasks)
+        return sum(self.rollout_pool.map(_pool_rollouts,
+                   [(board, toplay, share + (i < extra)) + settings for i in range(tasks)]))
+
+    def _stop_search(self, n, num_simulation, start, deadline):
+        """
+        Check after n playouts whether the search should stop: it is out of
+        time, or no other root child can get more visits than the most
+        visited one in the playouts left. With a deadline, the playouts
+        left are estimated from the rate so far.
+        The prior visits of in-tree knowledge are not playouts, so the most
+        visited child must also lead by more than the playouts left in the
+        visits of this search alone, counted from _start_visits.
+        """
+        if deadline is not None:
+            now = time.time()
+            if now >= deadline:
+                return True
+            remaining = n * (deadline - now) / (now - start)
+        else:
+            remaining = num_simulation - n
+        # each playout adds leaf_rollouts visits
+        remaining *= self.leaf_rollouts
+        if not self.early_stop:
+            return False
+        visits = self.tree.child_visits(self.tree.root)
+        if len(visits) > 1:
+            # progressive widening only adds root children at the end
+            gained = visits.copy()
+            gained[:len(self._start_visits)] -= self._start_visits
+            for counts in (visits, gained):
+                second, first = np.partition(counts, -2)[-2:]
+                if first - second <= remaining:
+                    return False
+        if deadline is not None:
+            self.seconds_saved = deadline - now
+        else:
+            self.playouts_saved = num_simulation - n
+        return True
+
+    def _search(self, board, toplay, num_simulation, in_tree_knowledge, deadline=None, stop=None):
+        """
+        Run num_simulation playouts from the position on board, which is
+        left unchanged, or stop earlier once time.time() passes deadline
+        or the best move is decided, see _stop_search, or the threading
+        Event stop is set.
+        Returns the number of playouts run, at least one unless stopped.
+        Unless rewind is 'copy', all playouts are played on a single
+        simulation board that is reset to the root position after each one,
+        so no new board is built per playout.
+        """
+        start = time.time()
+        interval = self.check_interval
+        self.playouts_saved = 0
+        self.seconds_saved = 0.0
+        tree = self.tree
+        if not tree.expanded(tree.root):
+            self._expand(tree.root, board, toplay, in_tree_knowledge)
+        # the visits of the root children before the playouts of this
+        # search, priors included, see _stop_search
+        self._start_visits = tree.child_visits(tree.root).copy()
+        if self.rewind == 'copy':
+            for n in range(num_simulation):
+                if stop is not None and stop.is_set():
+                    return n
+                if n and n % interval == 0 and self._stop_search(n, num_simulation, start, deadline):
+                    return n
+                board_copy = board.copy()
+                self._playout(board_copy, toplay, in_tree_knowledge)
+                self._check_budget()
+            return num_simulation
+        sim_board = board.copy()
+        root_mark = len(sim_board.moves)
+        for n in range(num_simulation):
+            if stop is not None and stop.is_set():
+                return n
+            if n and n % interval == 0 and self._stop_search(n, num_simulation, start, deadline):
+                return n
+            self._playout(sim_board, toplay, in_tree_knowledge)
+            self._check_budget()
+            if self.rewind == 'undo':
+                sim_board.undo_to(root_mark)
+            else:
+                board.copy_into(sim_board)
+        return num_simulation
+
+    def search(self,
             board,
             toplay,
             komi,
@@ -230,14 +814,16 @@ class MCTS(object):
             num_simulation,
             exploration,
             simulation_policy,
-            in_tree_knowledge):
+            in_tree_knowledge,
+            time_limit=None):
         """
-        Runs all playouts sequentially and returns the most visited move.
+        The search of get_move, which grows the tree from the position on
+        board without choosing a move.
         """
         if self.toplay != toplay:
             sys.stderr.write("Dumping the subtree! \n")
             sys.stderr.flush()
-            self._root = TreeNode(None)
+            self.clear_tree()
         self.komi = komi
         self.limit = limit
         self.check_selfatari = check_selfatari
@@ -246,75 +832,139 @@ class MCTS(object):
         self.exploration = exploration
         self.simulation_policy = simulation_policy
         self.in_tree_knowledge = in_tree_knowledge
-        for n in range(num_simulation):
-            board_copy = board.copy()
-            self._playout(board_copy, toplay, in_tree_knowledge)
+        start = time.time()
+        deadline = None
+        if time_limit is not None:
+            deadline = start + time_limit
+            num_simulation = sys.maxsize
+        # gc.freeze and gc.unfreeze act on every object of the process,
+        # not only on the tree; the collector is left as enabled or
+        # disabled as the caller had it
+        gc_enabled = gc.isenabled()
+        if self.gc_freeze:
+            gc.unfreeze()
+            gc.collect(1)
+            gc.disable()
+        try:
+            self.num_playouts = self._search(board, toplay, num_simulation, in_tree_knowledge, deadline)
+        finally:
+            if self.gc_freeze:
+                gc.freeze()
+                if gc_enabled:
+                    gc.enable()
+        self.search_time = time.time() - start
+
+    def get_move(self,
+            board,
+            toplay,
+            komi,
+            limit,
+            check_selfatari,
+            use_pattern,
+            num_simulation,
+            exploration,
+            simulation_policy,
+            in_tree_knowledge,
+            time_limit=None):
+        """
+        Runs all playouts sequentially and returns the most visited move.
+        With a time_limit in seconds, playouts run until it is used up
+        instead of num_simulation times.
+        """
+        self.search(board, toplay, komi, limit, check_selfatari, use_pattern,
+                    num_simulation, exploration, simulation_policy, in_tree_knowledge,
+                    time_limit)
         # choose a move that has the most visit
-        moves_ls =  [(move, node._n_visits) for move, node in self._root._children.items()]
+        tree = self.tree
+        moves_ls =  [(move, tree.get_visits(node)) for move, node in tree.children(tree.root)]
         if not moves_ls:
             return None
         moves_ls = sorted(moves_ls,key=lambda i:i[1],reverse=True)
         move = moves_ls[0]
-        self.print_stat(board, self._root, toplay)
+        self.print_stat(board, tree.root, toplay)
         #self.good_print(board,self._root,self.toplay,10)
         if move[0] == PASS:
             return None
         assert board.check_legal(move[0], toplay)
         return move[0]
 
+    def ponder(self, board, toplay, stop):
+        """
+        Run playouts from the position on board, which must be the root of
+        the tree, until the threading Event stop is set. Uses the settings
+        of the last get_move. Returns the number of playouts run.
+        """
+        return self._search(board, toplay, sys.maxsize, self.in_tree_knowledge, stop=stop)
+
+    def clear_tree(self):
+        self.tree = self._new_tree()
+        if self.table is not None:
+            self.table.clear()
+
+    def reset(self):
+        """
+        Forget the game, for a new one.
+        """
+        self.clear_tree()
+        self.toplay = BLACK
+        self.num_playouts = 0
+        self.prunes = 0
+        self.pruned_nodes = 0
+        self.prior_cache.clear()
+
     def update_with_move(self, last_move):
         """
         Step forward in the tree, keeping everything we already know about the subtree, assuming
         that get_move() has been called already. Siblings of the new root will be garbage-collected.
         """
-        if last_move in self._root._children:
-            self._root = self._root._children[last_move]
-        else:
-            self._root = TreeNode(None)
-        self._root._parent = None
+        self.tree = self.tree.subtree(last_move)
+        # the table refers to nodes of the old tree
+        if self.table is not None:
+            self.table.clear()
         self.toplay = GoBoardUtilGo4.opponent(self.toplay)
 
     def good_print(self, board, node, color, num_nodes):
+        tree = self.tree
         cboard = board.copy()
         sys.stderr.write("\nTaking a tour of selection policy in tree! \n\n")
         sys.stderr.write(cboard.get_twoD_board())
         sys.stderr.flush()
-        while not node.is_leaf():
-            if node._move != None:
-                if node._move != PASS:
-                    pointString = board.point_to_string(move)
-                else:
-                    pointString = node._move
-            else:
+        while tree.expanded(node):
+            if node == tree.root:
                 pointString = 'Root'
+            elif tree.get_move(node) != PASS:
+                pointString = board.point_to_string(tree.get_move(node))
+            else:
+                pointString = PASS
+            children = tree.children(node)
             sys.stderr.write("\nMove: {} Numebr of children {}, Number of visits: {}\n"
-                .format(pointString,len(node._children),node._n_visits))
+                .format(pointString,len(children),tree.get_visits(node)))
             sys.stderr.flush()
             moves_ls = []
             max_flag = color == BLACK
-            for move,child in node._children.items():
-                uctval = uct_val(node,child,self.exploration,max_flag)
+            for move,child in children:
+                uctval = tree.uct_value(node,child,self.exploration,max_flag)
                 moves_ls.append((move,uctval,child))
             moves_ls = sorted(moves_ls,key=lambda i:i[1],reverse=True)
 
             if moves_ls:
                 sys.stderr.write("\nPrinting {} of {} childs that have highest UCT value \n\n".format(num_nodes, pointString))
                 sys.stderr.flush()
-                for i in range(num_nodes):
+                for i in range(min(num_nodes, len(moves_ls))):
                     move = moves_ls[i][0]
                     child_val = moves_ls[i][1]
                     child_node = moves_ls[i][2]
                     if move !=PASS:
                         sys.stderr.write("\nChild point:{} ;UCT Value {}; Number of visits: {}; Number of Black wins: {}\n"
-                            .format(cboard.point_to_string(move), child_val, child_node._n_visits, child_node._black_wins))
+                            .format(cboard.point_to_string(move), child_val, tree.get_visits(child_node), tree.get_black_wins(child_node)))
                         sys.stderr.flush()
                     else:
                         sys.stderr.write("\nChild point:{} ;UCT Value {}; Number of visits: {}; Number of Black wins: {} \n"
-                            .format(move, child_val, child_node._n_visits, child_node._black_wins))
+                            .format(move, child_val, tree.get_visits(child_node), tree.get_black_wins(child_node)))
                         sys.stderr.flush()
             # Greedily select next move.
             max_flag = color == BLACK
-            move, next_node = node.select(self.exploration,max_flag)
+            move, next_node = tree.select(node, self.exploration, max_flag, self.rave)
             if move==PASS:
                 move = None
             assert cboard.check_legal(move, color)
@@ -325,25 +975,50 @@ class MCTS(object):
             sys.stderr.flush()
             color = GoBoardUtilGo4.opponent(color)
             node = next_node
-        assert node.is_leaf()
         cboard.current_player = color
         leaf_value = self._evaluate_rollout(cboard, color)
         sys.stderr.write("\nWinner of simulation is: {} color, Black is 0 an \n".format(leaf_value))
         sys.stderr.flush()
 
     def print_stat(self, board, root, color):
+        tree = self.tree
         s_color = GoBoardUtilGo4.int_to_color(color)
-        sys.stderr.write("Number of children {} \n".format(len(root._children)))
+        children = tree.children(root)
+        sys.stderr.write("Number of children {} \n".format(len(children)))
+        sys.stderr.flush()
+        sys.stderr.write("Number of roots visits: {} \n".format(tree.get_visits(root)))
         sys.stderr.flush()
-        sys.stderr.write("Number of roots visits: {} \n".format(root._n_visits))
+        if self.leaf_rollouts > 1:
+            sys.stderr.write("Playouts: {} of {} rollouts in {:.2f} seconds \n".format(
+                self.num_playouts, self.leaf_rollouts, self.search_time))
+        else:
+            sys.stderr.write("Playouts: {} in {:.2f} seconds \n".format(self.num_playouts, self.search_time))
         sys.stderr.flush()
+        if self.playouts_saved:
+            sys.stderr.write("Stopped early, {} playouts saved \n".format(self.playouts_saved))
+            sys.stderr.flush()
+        elif self.seconds_saved >= 0.005:
+            sys.stderr.write("Stopped early, {:.2f} seconds saved \n".format(self.seconds_saved))
+            sys.stderr.flush()
+        if self.tree_store == 'arrays':
+            sys.stderr.write("Number of nodes: {}, {} bytes per node \n".format(tree.num_nodes(), tree.bytes_per_node))
+        else:
+            sys.stderr.write("Number of nodes: {} \n".format(tree.num_nodes()))
+        sys.stderr.flush()
+        if self.max_nodes:
+            sys.stderr.write(self.budget_info() + " \n")
+            sys.stderr.flush()
+        if self.table is not None:
+            sys.stderr.write("Transpositions: {} shared expansions, {} of {} table entries used \n"
+                .format(self.table.hits, len(self.table), self.table.size))
+            sys.stderr.flush()
         stats=[]
-        for move,node in root._children.items():
+        for move,node in children:
+            visits = tree.get_visits(node)
             if color == BLACK:
-                wins = node._black_wins
+                wins = tree.get_black_wins(node)
             else:
-                wins = node._n_visits - node._black_wins
-            visits = node._n_visits
+                wins = visits - tree.get_black_wins(node)
             if visits:
                 win_rate = round(float(wins)/visits,2)
             else:
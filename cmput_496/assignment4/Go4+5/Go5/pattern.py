@@ -4,7 +4,10 @@
 # Code is from the michi project on Github:
 # https://github.com/pasky/michi/blob/master/michi.py
 
-from functools import reduce
+from functools import reduce, lru_cache
+import hashlib
+import os
+import numpy as np
 import collections
 
 pat3src = [  # 3x3 playout patterns; X,O are colors, x,o are their inverses
@@ -79,9 +82,27 @@ def pat3_expand(pat):
             for p in [p, pat_swapcolors(p)]
             for p in pat_wildcards(''.join(p))]
 
-pat3list = [p.replace('O', 'x') for p in pat3src for p in pat3_expand(p)]
+@lru_cache(maxsize=None)
+def pat3_list():
+    return [p.replace('O', 'x') for p in pat3src for p in pat3_expand(p)]
 
-pat3set = set(pat3list)
+@lru_cache(maxsize=None)
+def pat3_set():
+    return set(pat3_list())
+
+def pattern_code(pattern, color):
+    """
+    Integer code of a pattern string for color to play (1 black, 2 white),
+    X being color and x the opponent. This is the code SimpleGoBoard keeps
+    in pattern_codes: the 8 cells around the center in row order take
+    2 bits each, lowest bits first, with 0 empty, 1 black, 2 white and
+    3 border.
+    """
+    cells = {'.': 0, 'X': color, 'x': 3 - color, ' ': 3}
+    code = 0
+    for i, c in enumerate(pattern[:4] + pattern[5:]):
+        code |= cells[c] << 2*i
+    return code
 
 def switch_color(pattern):
     p = pattern
@@ -97,7 +118,7 @@ def generate_pattern_index():
     """
     index = 0
     p_index = {}
-    for p in pat3list:
+    for p in pat3_list():
         if p in p_index:
             continue
         p1 = p[6]+p[3]+p[0]+p[7]+p[4]+p[1]+p[8]+p[5]+p[2]
@@ -127,7 +148,52 @@ def generate_pattern_index():
         index = index+1
     return p_index
 
-patIndex = generate_pattern_index()
+pattern_index = lru_cache(maxsize=None)(generate_pattern_index)
+
+# directory of the compiled pattern tables, next to the byte code
+PATTERN_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '__pycache__')
+
+def load_pattern_table(name, build):
+    """
+    Return the pattern table called name, a read-only array indexed by
+    [color to play, pattern code].
+    The table is compiled by build() once and saved to an .npy file keyed by
+    a hash of pat3src. Later loads memory-map that file, so they neither
+    expand the patterns nor read the whole table.
+    """
+    key = hashlib.sha1(repr(pat3src).encode()).hexdigest()[:16]
+    path = os.path.join(PATTERN_CACHE_DIR, '{}_{}.npy'.format(name, key))
+    try:
+        return np.load(path, mmap_mode='r').view(np.ndarray)
+    except (OSError, ValueError):
+        pass
+    table = build()
+    table.flags.writeable = False
+    try:
+        os.makedirs(PATTERN_CACHE_DIR, exist_ok=True)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            np.save(f, table)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass # no cache, compile again next time
+    return table
 
+def build_pattern_table():
+    table = np.zeros((3, 4**8), dtype=np.bool_)
+    for p in pat3_set():
+        for color in (1, 2):
+            table[color, pattern_code(p, color)] = True
+    return table
 
+def build_pattern_index_table():
+    table = np.ones((3, 4**8), dtype=np.int16) * -1
+    for p, index in pattern_index().items():
+        for color in (1, 2):
+            table[color, pattern_code(p, color)] = index
+    return table
 
+# pat3table[color, code] tells if the pattern with code is in pat3_set() for
+# color to play, patIndexTable[color, code] is its pattern_index() or -1
+pat3table = load_pattern_table('pat3table', build_pattern_table)
+patIndexTable = load_pattern_table('patIndexTable', build_pattern_index_table)
@@ -0,0 +1,156 @@
+"""
+Root parallel MCTS: worker processes search the same root position each
+in their own tree, and the statistics of the root children are added up.
+"""
+import multiprocessing
+import random
+import sys
+import time
+import numpy as np
+from mcts import MCTS
+
+def _worker(conn, tree_store, transpositions, seed):
+    """
+    Main loop of a worker process. Messages are tuples of a command and
+    its arguments:
+    ('search', leaf_rollouts, board, toplay, search arguments) -- run
+        MCTS.search with leaf_rollouts rollouts per leaf and send back the
+        root children as (move, visits, black wins), the number of
+        playouts and the number of nodes
+    ('update', move) -- MCTS.update_with_move
+    ('clear',) -- MCTS.clear_tree
+    ('reset',) -- MCTS.reset
+    ('close',) -- end the worker
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    mcts = MCTS(tree_store, transpositions)
+    # another worker can change the most visited child after this one
+    # has decided it, see RootParallelMCTS
+    mcts.early_stop = False
+    while True:
+        message = conn.recv()
+        command = message[0]
+        if command == 'search':
+            mcts.leaf_rollouts = message[1]
+            mcts.search(*message[2:])
+            tree = mcts.tree
+            children = [(move, tree.get_visits(child), tree.get_black_wins(child))
+                        for move, child in tree.children(tree.root)]
+            conn.send((children, mcts.num_playouts, tree.num_nodes()))
+        elif command == 'update':
+            mcts.update_with_move(message[1])
+        elif command == 'clear':
+            mcts.clear_tree()
+        elif command == 'reset':
+            mcts.reset()
+        elif command == 'close':
+            conn.close()
+            return
+
+class RootParallelMCTS(MCTS):
+    """
+    MCTS with the playouts of each move split over num_workers worker
+    processes. The workers are started once and keep their trees from move
+    to move. Each has its own random seed, so their searches differ.
+
+    After a search, self.tree, in the tree store of the workers, holds
+    only the root and its children, with the visits and black wins of all
+    workers added up, and get_move picks the most visited child from it
+    as usual.
+    """
+    def __init__(self, num_workers, tree_store='objects', transpositions=0, seed=None):
+        # the transposition tables are in the workers
+        MCTS.__init__(self, tree_store)
+        self.num_workers = num_workers
+        if seed is None:
+            seed = random.randrange(1 << 30)
+        self._connections = []
+        self._workers = []
+        for i in range(num_workers):
+            conn, worker_conn = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=_worker,
+                    args=(worker_conn, tree_store, transpositions, seed + i))
+            worker.daemon = True
+            worker.start()
+            self._connections.append(conn)
+            self._workers.append(worker)
+        self.worker_nodes = [0] * num_workers
+
+    def _send(self, *message):
+        for conn in self._connections:
+            conn.send(message)
+
+    def search(self,
+            board,
+            toplay,
+            komi,
+            limit,
+            check_selfatari,
+            use_pattern,
+            num_simulation,
+            exploration,
+            simulation_policy,
+            in_tree_knowledge,
+            time_limit=None):
+        """
+        Run the search of MCTS.get_move in the workers, num_simulation
+        playouts in all, and merge their root children into self.tree.
+        """
+        self.toplay = toplay
+        self.exploration = exploration
+        start = time.time()
+        # the first num_simulation % num_workers workers run one more
+        share, extra = divmod(num_simulation, self.num_workers)
+        for i, conn in enumerate(self._connections):
+            conn.send(('search', self.leaf_rollouts, board, toplay, komi, limit, check_selfatari,
+                       use_pattern, max(1, share + (i < extra)), exploration,
+                       simulation_policy, in_tree_knowledge, time_limit))
+        results = [conn.recv() for conn in self._connections]
+        # all workers expand the root in the same order
+        visits = {}
+        black_wins = {}
+        moves = []
+        for children, _, _ in results:
+            for move, n, wins in children:
+                if move not in visits:
+                    moves.append(move)
+                    visits[move] = 0
+                    black_wins[move] = 0
+                visits[move] += n
+                black_wins[move] += wins
+        self.tree = self._new_tree()
+        self.tree.expand(self.tree.root, moves,
+                         [visits[m] for m in moves], [black_wins[m] for m in moves])
+        self.tree.backup([self.tree.root], sum(black_wins.values()), sum(visits.values()))
+        self.num_playouts = sum(result[1] for result in results)
+        self.worker_nodes = [result[2] for result in results]
+        self.search_time = time.time() - start
+
+    def print_stat(self, board, root, color):
+        MCTS.print_stat(self, board, root, color)
+        sys.stderr.write("Root parallel: {} workers, {} nodes in their trees \n"
+                         .format(self.num_workers, sum(self.worker_nodes)))
+        sys.stderr.flush()
+
+    def update_with_move(self, last_move):
+        self._send('update', last_move)
+        MCTS.update_with_move(self, last_move)
+
+    def reset(self):
+        self._send('reset')
+        MCTS.reset(self)
+
+    def clear_tree(self):
+        self._send('clear')
+        self.tree = self._new_tree()
+
+    def close(self):
+        """
+        Stop the worker processes.
+        """
+        self._send('close')
+        for worker in self._workers:
+            worker.join()
+        self._connections = []
+        self._workers = []
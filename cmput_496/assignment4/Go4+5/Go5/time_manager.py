@@ -0,0 +1,91 @@
+"""
+Time control for Go5: turns the GTP time settings into a time budget for
+the search of each move.
+"""
+from board_util_go4 import BLACK, WHITE
+
+class TimeManager(object):
+    """
+    Keeps the time settings and the time left of both players, set by the
+    GTP commands time_settings, time_left and genmove_time.
+
+    move_budget returns the seconds to search the next move, or None when
+    there is no time limit and the search runs a fixed number of playouts.
+    """
+    # part of the budget kept back for the work around the search
+    SAFETY_MARGIN = 0.1
+    # the fewest moves the remaining main time is spread over
+    MIN_MOVES_LEFT = 10
+
+    def __init__(self):
+        # fixed seconds per move from genmove_time, None if not set
+        self.move_time = None
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the time settings and the time left, for a new game. The
+        controller sends time_settings again after clear_board; like the
+        other engine settings, genmove_time is kept.
+        """
+        self.main_time = None
+        self.byo_yomi_time = 0
+        self.byo_yomi_stones = 0
+        # color -> [seconds left, stones left in the byo-yomi period, 0 in main time]
+        self.time_left = {}
+
+    def set_time_settings(self, main_time, byo_yomi_time, byo_yomi_stones):
+        """
+        GTP time_settings. byo_yomi_time > 0 with byo_yomi_stones = 0
+        means there is no time limit.
+        """
+        self.main_time = main_time
+        self.byo_yomi_time = byo_yomi_time
+        self.byo_yomi_stones = byo_yomi_stones
+        self.time_left = {BLACK: [main_time, 0], WHITE: [main_time, 0]}
+        if main_time == 0 and byo_yomi_stones > 0:
+            for color in self.time_left:
+                self.time_left[color] = [byo_yomi_time, byo_yomi_stones]
+
+    def set_time_left(self, color, seconds, stones):
+        self.time_left[color] = [seconds, stones]
+
+    def unlimited(self):
+        return self.main_time is None or (self.byo_yomi_time > 0 and self.byo_yomi_stones == 0)
+
+    def move_budget(self, board, color):
+        if self.move_time is not None:
+            return self.move_time
+        if self.unlimited():
+            return None
+        seconds, stones = self.time_left.get(color, (self.main_time, 0))
+        if stones > 0:
+            # byo-yomi: share the period between the stones still to play
+            budget = float(seconds) / stones
+        else:
+            # main time: spread it over the moves expected to be left in the
+            # game, about one for each player per two empty points
+            moves_left = max(self.MIN_MOVES_LEFT, len(board.get_empty_points()) // 2)
+            budget = float(seconds) / moves_left
+            if self.byo_yomi_stones > 0:
+                budget += float(self.byo_yomi_time) / self.byo_yomi_stones
+        return max(0.0, budget * (1 - self.SAFETY_MARGIN))
+
+    def spent(self, color, seconds):
+        """
+        Count seconds used for a move of color, until the next time_left
+        tells the actual time left.
+        """
+        if color not in self.time_left:
+            return
+        left = self.time_left[color]
+        left[0] -= seconds
+        if left[1] > 0:
+            left[1] -= 1
+            if left[1] == 0:
+                # a new byo-yomi period
+                left[0] = self.byo_yomi_time
+                left[1] = self.byo_yomi_stones
+        elif left[0] <= 0 and self.byo_yomi_stones > 0:
+            left[0] = self.byo_yomi_time
+            left[1] = self.byo_yomi_stones
@@ -0,0 +1,53 @@
+"""
+Transposition table for MCTS, so positions reached by different move
+orders share one expansion and the statistics of its children.
+"""
+
+class TranspositionTable(object):
+    """
+    Fixed size table from positions to expanded tree nodes, a node being
+    whatever the tree store uses (TreeNode or ArrayTree index).
+
+    A position is keyed by board.position_hash together with the number of
+    moves played, so a node is only shared with nodes at the same depth and
+    the search graph stays acyclic (passes would otherwise lead back to a
+    position higher up in the tree).
+
+    The table is direct mapped: each key has one slot, and storing a key in
+    a slot held by another key replaces it.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.clear()
+
+    def clear(self):
+        self._keys = [None] * self.size
+        self._nodes = [None] * self.size
+        self.hits = 0
+        self.stores = 0
+        self.replacements = 0
+
+    @staticmethod
+    def key(board):
+        return board.position_hash, len(board.moves)
+
+    def lookup(self, key):
+        """
+        Return the node stored for key, or None.
+        """
+        slot = hash(key) % self.size
+        if self._keys[slot] == key:
+            self.hits += 1
+            return self._nodes[slot]
+        return None
+
+    def store(self, key, node):
+        slot = hash(key) % self.size
+        if self._keys[slot] is not None:
+            self.replacements += 1
+        self._keys[slot] = key
+        self._nodes[slot] = node
+        self.stores += 1
+
+    def __len__(self):
+        return self.size - self._keys.count(None)
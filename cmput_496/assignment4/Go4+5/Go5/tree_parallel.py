@@ -0,0 +1,292 @@
+"""
+Tree parallel MCTS: worker processes run playouts on one ArrayTree kept
+in multiprocessing.shared_memory, spread over the tree by virtual loss.
+"""
+import atexit
+import multiprocessing
+from multiprocessing import shared_memory
+import random
+import sys
+import time
+import numpy as np
+from mcts import MCTS, expansion
+from array_tree import ArrayTree, PASS, PASS_POINT
+from board_util_go4 import GoBoardUtilGo4, BLACK
+
+class SharedArrayTree(ArrayTree):
+    """
+    ArrayTree of fixed capacity whose arrays, and the number of nodes,
+    live in a shared memory block, so that every process that attaches to
+    the block by name works on the same tree.
+    A full tree is not grown: expand must only be called when fits().
+    """
+    def __init__(self, capacity, name=None):
+        nbytes = 8 + len(self._fields) * capacity * 4
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self._header = np.ndarray((1), dtype=np.int64, buffer=self.shm.buf)
+        for i, field in enumerate(self._fields):
+            setattr(self, field, np.ndarray((capacity), dtype=np.int32,
+                    buffer=self.shm.buf, offset=8 + i * capacity * 4))
+        self.root = 0
+        if name is None:
+            self.clear()
+
+    @property
+    def size(self):
+        return int(self._header[0])
+
+    @size.setter
+    def size(self, value):
+        self._header[0] = value
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def clear(self):
+        """
+        Make the tree a single unexpanded root.
+        """
+        self.size = 1
+        self.visits[0] = 0
+        self.black_wins[0] = 0
+        self.first_child[0] = -1
+        self.num_children[0] = 0
+        self.num_moves[0] = 0
+        self.move[0] = PASS_POINT
+        self.parent[0] = -1
+
+    def fits(self, n):
+        return self.size + n <= self.capacity
+
+    def _reserve(self, n):
+        if not self.fits(n):
+            raise MemoryError("shared MCTS tree is full")
+
+    def load(self, tree):
+        """
+        Replace the contents of this tree with the ArrayTree tree.
+        """
+        n = tree.size
+        for field in self._fields:
+            getattr(self, field)[:n] = getattr(tree, field)[:n]
+        self.size = n
+
+    def close(self, unlink=False):
+        # drop the views on the block before closing it
+        self._header = None
+        for field in self._fields:
+            setattr(self, field, None)
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+class TreeParallelWorker(MCTS):
+    """
+    The search of a worker process. _playout follows MCTS._playout, but
+    only the work on the shared tree is done holding lock: the descent,
+    the expansion and the backup. The moves, the move generation of the
+    expansion and the rollout run unlocked, in parallel with the other
+    workers.
+
+    On the way down, each node gets a virtual loss: a visit counted as a
+    loss for the player who chose it. Other workers then see the path as
+    worse and take other ones. The backup turns the virtual losses into
+    the real result.
+    """
+    def __init__(self, tree, lock):
+        MCTS.__init__(self, 'arrays')
+        self.tree = tree
+        self.lock = lock
+        # the leader can change through the playouts of other workers
+        self.early_stop = False
+
+    def _playout(self, board, color, in_tree_knowledge):
+        tree = self.tree
+        moves = []
+        path = []
+        # black wins added as virtual loss to the nodes on path
+        virtual_wins = []
+        with self.lock:
+            node = tree.root
+            path.append(node)
+            virtual_wins.append(0)
+            tree.visits[node] += 1
+            to_play = color
+            while tree.expanded(node):
+                max_flag = to_play == BLACK
+                move, node = tree.select(node, self.exploration, max_flag)
+                loss = 0 if max_flag else 1
+                tree.visits[node] += 1
+                tree.black_wins[node] += loss
+                moves.append(move)
+                path.append(node)
+                virtual_wins.append(loss)
+                to_play = GoBoardUtilGo4.opponent(to_play)
+        for move in moves:
+            board.move(None if move == PASS else move, color)
+            color = GoBoardUtilGo4.opponent(color)
+        children = expansion(board, color, in_tree_knowledge)
+        with self.lock:
+            # another worker may have expanded node in the meantime
+            if not tree.expanded(node) and tree.fits(len(children[0])):
+                tree.expand(node, *children)
+        assert board.current_player == color
+        n = self.leaf_rollouts
+        if n > 1:
+            leaf_value = self._evaluate_rollouts(board, color, n)
+        else:
+            leaf_value = self._evaluate_rollout(board, color)
+        with self.lock:
+            # the descent already counted one visit of each node on path
+            if n > 1:
+                tree.visits[path] += n - 1
+            tree.black_wins[path] += leaf_value - np.array(virtual_wins)
+
+    def search(self, board, toplay, komi, limit, check_selfatari, use_pattern,
+               num_simulation, exploration, simulation_policy, in_tree_knowledge,
+               time_limit=None):
+        """
+        Run num_simulation playouts, or playouts until time_limit is used
+        up, on the shared tree. Returns the number of playouts.
+        """
+        self.komi = komi
+        self.limit = limit
+        self.check_selfatari = check_selfatari
+        self.use_pattern = use_pattern
+        self.toplay = toplay
+        self.exploration = exploration
+        self.simulation_policy = simulation_policy
+        self.in_tree_knowledge = in_tree_knowledge
+        deadline = None
+        if time_limit is not None:
+            deadline = time.time() + time_limit
+            num_simulation = sys.maxsize
+        return self._search(board, toplay, num_simulation, in_tree_knowledge, deadline)
+
+def _worker(conn, name, capacity, lock, seed):
+    """
+    Main loop of a worker process. It gets ('search', leaf_rollouts, board,
+    toplay, search arguments) messages and sends back the number of
+    playouts run, with leaf_rollouts rollouts per leaf, until it gets
+    ('close',).
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    tree = SharedArrayTree(capacity, name)
+    worker = TreeParallelWorker(tree, lock)
+    while True:
+        message = conn.recv()
+        if message[0] == 'search':
+            worker.leaf_rollouts = message[1]
+            conn.send(worker.search(*message[2:]))
+        elif message[0] == 'close':
+            tree.close()
+            conn.close()
+            return
+
+class TreeParallelMCTS(MCTS):
+    """
+    MCTS with the playouts of each move split over num_workers worker
+    processes that search one shared tree of at most capacity nodes,
+    see TreeParallelWorker. The tree is an ArrayTree in shared memory, and
+    self.shared is this process's view of it. After a search self.tree is
+    self.shared, so get_move and the statistics work on it as for a single
+    process search. update_with_move makes self.tree a new ArrayTree of
+    the subtree kept, and the next search loads it into the shared tree,
+    so the searched tree is left as it was until then.
+    """
+    def __init__(self, num_workers, capacity=1 << 20, seed=None):
+        MCTS.__init__(self, 'arrays')
+        self.shared = SharedArrayTree(capacity)
+        self.tree = self.shared
+        self.num_workers = num_workers
+        self.lock = multiprocessing.Lock()
+        if seed is None:
+            seed = random.randrange(1 << 30)
+        self._connections = []
+        self._workers = []
+        for i in range(num_workers):
+            conn, worker_conn = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=_worker,
+                    args=(worker_conn, self.shared.name, capacity, self.lock, seed + i))
+            worker.daemon = True
+            worker.start()
+            self._connections.append(conn)
+            self._workers.append(worker)
+        # GTP quit exits without closing the search
+        atexit.register(self.close)
+
+    def search(self,
+            board,
+            toplay,
+            komi,
+            limit,
+            check_selfatari,
+            use_pattern,
+            num_simulation,
+            exploration,
+            simulation_policy,
+            in_tree_knowledge,
+            time_limit=None):
+        """
+        Run the search of MCTS.get_move in the workers, num_simulation
+        playouts in all.
+        """
+        if self.toplay != toplay:
+            sys.stderr.write("Dumping the subtree! \n")
+            sys.stderr.flush()
+            self.clear_tree()
+        if self.tree is not self.shared:
+            self.shared.load(self.tree)
+            self.tree = self.shared
+        self.toplay = toplay
+        self.exploration = exploration
+        self.in_tree_knowledge = in_tree_knowledge
+        start = time.time()
+        if not self.tree.expanded(self.tree.root):
+            self._expand(self.tree.root, board, toplay, in_tree_knowledge)
+        share, extra = divmod(num_simulation, self.num_workers)
+        for i, conn in enumerate(self._connections):
+            conn.send(('search', self.leaf_rollouts, board, toplay, komi, limit, check_selfatari,
+                       use_pattern, max(1, share + (i < extra)), exploration,
+                       simulation_policy, in_tree_knowledge, time_limit))
+        self.num_playouts = sum(conn.recv() for conn in self._connections)
+        self.search_time = time.time() - start
+
+    def print_stat(self, board, root, color):
+        MCTS.print_stat(self, board, root, color)
+        sys.stderr.write("Tree parallel: {} workers, {} of {} nodes used \n"
+                         .format(self.num_workers, self.tree.num_nodes(), self.tree.capacity))
+        sys.stderr.flush()
+
+    def clear_tree(self):
+        self.tree = self.shared
+        self.tree.clear()
+
+    def update_with_move(self, last_move):
+        """
+        Keep the subtree of last_move, compacted into a new ArrayTree that
+        the next search loads into the shared tree.
+        """
+        self.tree = ArrayTree.subtree(self.tree, last_move)
+        self.toplay = GoBoardUtilGo4.opponent(self.toplay)
+
+    def close(self):
+        """
+        Stop the worker processes and free the shared tree.
+        """
+        if self.shared is None:
+            return
+        for conn in self._connections:
+            conn.send(('close',))
+        for worker in self._workers:
+            worker.join()
+        self._connections = []
+        self._workers = []
+        self.shared.close(unlink=True)
+        self.shared = None
+        self.tree = None
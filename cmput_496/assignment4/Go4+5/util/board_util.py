@@ -5,10 +5,11 @@ BORDER = 3
 FLOODFILL = 4
 import numpy as np
 import random
-import copy
-from pattern import pat3set
+from pattern import pat3table
 import sys
 
+# number of random empty points generate_random_move tries before scanning
+RANDOM_MOVE_PROBES = 8
 
 class GoBoardUtil(object):
     
@@ -24,17 +25,7 @@ class GoBoardUtil(object):
         color : {'b','w'}
             the color to generate the move for.
         """
-        moves = board.get_empty_points()
-        num_moves = len(moves)
-        np.random.shuffle(moves)
-        illegal_moves = []
-
-        for i in range(num_moves):
-            if board.check_legal(moves[i],color):
-                continue
-            else:
-                illegal_moves.append(i)
-        legal_moves = np.delete(moves,illegal_moves)
+        legal_moves = np.flatnonzero(board.legal_mask(color, exclude_eyes=False))
         gtp_moves=[]
         for point in legal_moves:
             x,y = board._point_to_coord(point)
@@ -54,18 +45,32 @@ class GoBoardUtil(object):
             a SIZExSIZE array representing the board
         color : {'b','w'}
             the color to generate the move for.
+
+        A few randomly drawn empty points are tried first, which finds a
+        move without touching all empty points in most positions. Only if
+        they all fail are the remaining empty points scanned in random order.
         """
-        moves = board.get_empty_points()
+        moves = board.get_empty_points_view()
         num_moves = len(moves)
-        np.random.shuffle(moves)
-        for i in range(num_moves):
-            if is_eye_filter and board.is_eye(moves[i],color):
+        tried = set()
+        for _ in range(min(num_moves, RANDOM_MOVE_PROBES)):
+            i = random.randrange(num_moves)
+            if i in tried:
+                continue
+            tried.add(i)
+            move = int(moves[i])
+            if is_eye_filter and board.is_eye(move,color):
+                continue
+            if board.check_legal(move,color):
+                return move
+        for i in np.random.permutation(num_moves):
+            if i in tried:
                 continue
-            move = moves[i]
-            legal = board.check_legal(move,color)
-            if not legal:
+            move = int(moves[i])
+            if is_eye_filter and board.is_eye(move,color):
                 continue
-            return move
+            if board.check_legal(move,color):
+                return move
         return None
     
 
@@ -163,10 +168,8 @@ class GoBoardUtil(object):
          
     @staticmethod
     def copyb2b(board,copy_board):
-        """Return an independent copy of this Board."""
-        copy_board.__dict__ = copy.deepcopy(board.__dict__)
-        assert copy_board.board.all() == board.board.all()
-        return copy_board
+        """Copy board into copy_board, reusing its arrays, and return it."""
+        return board.copy_into(copy_board)
 
     @staticmethod
     def sorted_point_string(points, ns):
@@ -180,9 +183,10 @@ class GoBoardUtil(object):
     def generate_pattern_moves(board):
         color = board.current_player
         pattern_checking_set = board.last_moves_empty_neighbors()
+        is_pattern = pat3table[color]
         moves = []
         for p in pattern_checking_set:
-            if (board.neighborhood_33(p) in pat3set):
+            if is_pattern[board.pattern_codes[p]]:
                 assert p not in moves
                 assert board.board[p] == EMPTY
                 moves.append(p)
@@ -205,6 +209,8 @@ class GoBoardUtil(object):
 
     @staticmethod 
     def filter_moves_and_generate(board, moves, check_selfatari):
+        # the first random candidate usually passes, so the candidates are
+        # tested one at a time rather than filtered all at once
         color = board.current_player
         while len(moves) > 0:
             candidate = random.choice(moves)
@@ -217,10 +223,11 @@ class GoBoardUtil(object):
     @staticmethod
     def filter_moves(board, moves, check_selfatari):
         color = board.current_player
-        good_moves = []
-        for move in moves:
-            if not GoBoardUtil.filter(board,move,color,check_selfatari):
-                good_moves.append(move)
+        good_moves = [move for move in moves if not GoBoardUtil.filleye_filter(board, move, color)]
+        if check_selfatari and len(good_moves) > 0:
+            # one self-atari test over all the moves left
+            selfatari = board.selfatari(good_moves, color)
+            good_moves = [move for move, s in zip(good_moves, selfatari) if not s]
         return good_moves
 
     # return True if move should be filtered
@@ -246,15 +253,8 @@ class GoBoardUtil(object):
 
     @staticmethod
     def generate_random_moves(board,is_eye_filter):
-        empty_points = board.get_empty_points()
         color = board.current_player
-        moves = []
-        for move in empty_points:
-            if is_eye_filter and board.is_eye(move,color):
-                continue 
-            if board.check_legal(move, color):
-                moves.append(move)
-        return moves
+        return np.flatnonzero(board.legal_mask(color, is_eye_filter)).tolist()
 
     @staticmethod 
     def generate_move_with_filter(board, use_pattern, check_selfatari):
@@ -276,17 +276,7 @@ class GoBoardUtil(object):
     
     @staticmethod
     def selfatari(board, move, color):
-        max_old_liberty = GoBoardUtil.blocks_max_liberty(board, move, color, 2)
-        if max_old_liberty > 2:
-            return False
-        cboard = board.copy()
-        # swap out true board for simulation board, and try to play the move
-        isLegal = cboard.move(move, color) 
-        if isLegal:               
-            new_liberty = cboard._liberty(move,color)
-            if new_liberty==1:
-                return True 
-        return False
+        return bool(board.selfatari([move], color)[0])
 
     @staticmethod
     def blocks_max_liberty(board, point, color, limit):
@@ -14,10 +14,112 @@ glossary:
 
 
 import numpy as np
-import copy
+import random
 from board_util import GoBoardUtil, BLACK, WHITE, EMPTY, BORDER, FLOODFILL 
-import sys
-sys.setrecursionlimit(1000000)
+
+_zobrist_cache = {}
+
+def zobrist_keys(maxpoint):
+    """
+    Random 64-bit keys for Zobrist hashing of boards with maxpoint points.
+    The keys are generated from a fixed seed and cached, so every board of
+    the same size, in every process, hashes a position to the same value.
+
+    Returns
+    -------
+    stone_keys : list indexed by [color][point], all zero for EMPTY
+    ko_keys : list indexed by the ko point
+    to_play_key : key for white to play
+    """
+    keys = _zobrist_cache.get(maxpoint)
+    if keys is None:
+        rng = random.Random(maxpoint)
+        stone_keys = [[0] * maxpoint,
+                      [rng.getrandbits(64) for _ in range(maxpoint)],
+                      [rng.getrandbits(64) for _ in range(maxpoint)]]
+        ko_keys = [rng.getrandbits(64) for _ in range(maxpoint)]
+        to_play_key = rng.getrandbits(64)
+        keys = (stone_keys, ko_keys, to_play_key)
+        _zobrist_cache[maxpoint] = keys
+    return keys
+
+class BoardTables(object):
+    """
+    Point tables that only depend on the board size. They are built once
+    per size by board_tables and shared by every board of that size, so
+    none of them may be modified.
+
+    initial_board : the empty board, a read-only array
+    points : all points on the board
+    neighbor_table, diag_table : (maxpoint, 4) int arrays with the 4
+        neighbors and the 4 diagonal neighbors of every point on the board,
+        border points included
+    window_table : (maxpoint, 9) int array with the 3x3 window around every
+        point on the board in row order, the point itself in the middle
+    Rows of the tables for border points are padded with point 0, which
+    is a border point.
+    neighbors_dic : the neighbors of every point that are on the board
+    neighbor_lists, diag_lists, window_lists : the table rows as lists,
+        for loops over single points
+    initial_pattern_codes : the pattern code of every point on the empty
+        board, see SimpleGoBoard.reset
+    pattern_updates : for every point, the (neighbor, weight) pairs of the
+        points on the board around it, where weight is the value of the
+        point's cell in the neighbor's pattern code
+    """
+    def __init__(self, size):
+        NS = size + 1
+        self.maxpoint = size*size + 3*(size+1)
+        board = np.ones((self.maxpoint),dtype=np.int16)*BORDER
+        for row in range(1, size+1):
+            board[row*NS+1:row*NS+size+1] = EMPTY
+        board.flags.writeable = False
+        self.initial_board = board
+        self.points = np.where(board == EMPTY)[0]
+        self.points.flags.writeable = False
+        self.neighbor_table = self._table([-1, 1, -NS, NS])
+        self.diag_table = self._table([-NS-1, -NS+1, NS-1, NS+1])
+        self.window_table = self._table([-NS-1, -NS, -NS+1,
+                                         -1, 0, 1,
+                                         NS-1, NS, NS+1])
+        self.neighbor_lists = self.neighbor_table.tolist()
+        self.diag_lists = self.diag_table.tolist()
+        self.window_lists = self.window_table.tolist()
+        self.neighbors_dic = {}
+        for p in self.points.tolist():
+            self.neighbors_dic[p] = [n for n in self.neighbor_lists[p]
+                                     if board[n] != BORDER]
+        # the 8 cells around a point, in the order of the 3x3 window
+        around = [0, 1, 2, 3, 5, 6, 7, 8]
+        weights = 4 ** np.arange(8)
+        self.initial_pattern_codes = [0] * self.maxpoint
+        self.pattern_updates = [[] for _ in range(self.maxpoint)]
+        for p in self.points.tolist():
+            cells = self.window_table[p][around]
+            self.initial_pattern_codes[p] = int(np.dot(board[cells], weights))
+            # the point is cell 7-k of its neighbor in direction k
+            self.pattern_updates[p] = [(int(n), int(weights[7-k]))
+                                       for k, n in enumerate(cells)
+                                       if board[n] != BORDER]
+
+    def _table(self, offsets):
+        table = np.zeros((self.maxpoint, len(offsets)),dtype=np.int32)
+        table[self.points] = self.points[:, None] + np.array(offsets)
+        table.flags.writeable = False
+        return table
+
+_board_tables_cache = {}
+
+def board_tables(size):
+    """
+    Return the BoardTables for boards of the given size, building them
+    on first use.
+    """
+    tables = _board_tables_cache.get(size)
+    if tables is None:
+        tables = BoardTables(size)
+        _board_tables_cache[size] = tables
+    return tables
 
 class SimpleGoBoard(object):
 
@@ -30,22 +132,26 @@ class SimpleGoBoard(object):
         color
         """
         previous_pass=self.num_pass
+        previous_ko = self.ko_constraint
         move_inspection, msg, caps = self._play_move(point,color)
         if not move_inspection:
             return False
         else:
             self.current_player = GoBoardUtil.opponent(color)
             self.moves.append(point)
-            self.ko_constraints.append(self.ko_constraint)
+            self.ko_constraints.append(previous_ko)
             self.captured_stones.append(caps)
             self.pass_record.append(previous_pass)
             self.last2_move = self.last_move
             self.last_move = point
             # update played and captured positions to the empty positions
             if point:
-                self._empty_positions.remove(point)
+                self._remove_empty(point)
             if caps is not None:
-                self._empty_positions.extend(caps)
+                for p in caps:
+                    self._add_empty(p)
+            if self.check_hash:
+                self._verify_hash()
             return True
                 
     # Undo and restore the full previous board state
@@ -55,15 +161,63 @@ class SimpleGoBoard(object):
         self.ko_constraint = self.ko_constraints.pop()
         caps = self.captured_stones.pop()
         self.num_pass=self.pass_record.pop()
+        block_record = self.block_records.pop()
         if last_point != None:
-            self.board[last_point] = EMPTY
-            self.liberty_dp[last_point] = -1
-            self._empty_positions.append(last_point)
             c = self.current_player
+            self._undo_stone(last_point, GoBoardUtil.opponent(c), block_record)
+            self._add_empty(last_point)
             for p in caps:
-                self.board[p] = c
-                self._empty_positions.remove(p)
+                self._remove_empty(p)
+            if c == WHITE:
+                self.black_captures -= len(caps)
+            else:
+                self.white_captures -= len(caps)
+        self.last_move = self.moves[-1] if len(self.moves) > 0 else None
+        self.last2_move = self.moves[-2] if len(self.moves) > 1 else None
         self.current_player = GoBoardUtil.opponent(self.current_player);
+        if self.check_hash:
+            self._verify_hash()
+
+    def undo_to(self, mark):
+        """
+        Undo moves until only mark moves are left on the move stack.
+        Taking mark = len(board.moves) before a simulation and calling
+        undo_to(mark) after it rewinds the board without copying it.
+        """
+        while len(self.moves) > mark:
+            self.undo_move()
+
+    @property
+    def position_hash(self):
+        """
+        64-bit Zobrist hash of the position: stones, player to move and
+        ko point. The stone part is updated incrementally by move and
+        undo_move, so this is O(1).
+        """
+        h = self._stone_hash
+        if self.current_player == WHITE:
+            h ^= self._to_play_key
+        if self.ko_constraint is not None:
+            h ^= self._ko_keys[self.ko_constraint]
+        return h
+
+    def _compute_stone_hash(self):
+        """
+        Recompute the Zobrist hash of the stones from scratch.
+        """
+        h = 0
+        for color in (BLACK, WHITE):
+            keys = self._stone_keys[color]
+            for p in np.where(self.board == color)[0]:
+                h ^= keys[p]
+        return h
+
+    def _verify_hash(self):
+        """
+        Debug check of the incremental hash, enabled by setting check_hash.
+        """
+        assert self._stone_hash == self._compute_stone_hash(), \
+            "incremental hash does not match the board"
 
     @staticmethod
     def showboard(board,bd_size):
@@ -95,21 +249,44 @@ class SimpleGoBoard(object):
             return False
         if point == self.ko_constraint:
             return False
-        # tentatively place the stone and check capture and suicide
-        self.board[point] = color
-        neighbors = self._neighbors(point)
+        return (not self.check_suicide) or not self._is_suicide(point, color)
+
+    def legal_mask(self, color, exclude_eyes=True):
+        """
+        Boolean array over all maxpoint points, True where color can legally
+        play. It is worked out for all empty points at once from the liberty
+        counts of the blocks next to them, instead of calling check_legal
+        point by point.
+        If exclude_eyes is set, the eyes of color (see is_eye) are excluded.
+        """
+        board = self.board
         opp = GoBoardUtil.opponent(color)
-        for n in neighbors:
-            assert self.board[n] != BORDER
-            if self.board[n] == opp:
-                hasLiberty,fboard = self._liberty_flood(n)
-                if not hasLiberty:
-                    self.board[point] = EMPTY
-                    return True
-        is_legal = (not self.check_suicide) or self._liberty_flood(point)[0]
-        # remove the stone again
-        self.board[point] = EMPTY
-        return is_legal
+        empty = self._empty_dense[:self._empty_count]
+        nb_points = self._tables.neighbor_table[empty]
+        nb = board[nb_points]
+        if self.check_suicide:
+            # liberty count by anchor; points without a stone have anchor -1,
+            # which reads the last point, a border point with count 0
+            anchor_libs = np.zeros((self.maxpoint),dtype=np.int32)
+            anchor_libs[list(self.block_libs)] = [len(libs) for libs in self.block_libs.values()]
+            nb_libs = anchor_libs[self.block_anchor[nb_points]]
+            # not suicide: an empty neighbor, a friendly block that keeps a
+            # liberty or an opponent block that gets captured
+            legal = ((nb == EMPTY)
+                     | ((nb == color) & (nb_libs > 1))
+                     | ((nb == opp) & (nb_libs == 1))).any(axis=1)
+        else:
+            legal = np.ones((len(empty)),dtype=np.bool_)
+        if exclude_eyes:
+            eyeish = ((nb == color) | (nb == BORDER)).all(axis=1)
+            diag = board[self._tables.diag_table[empty]]
+            false_count = (diag == opp).sum(axis=1) + (diag == BORDER).any(axis=1)
+            legal &= ~(eyeish & (false_count < 2))
+        mask = np.zeros((self.maxpoint),dtype=np.bool_)
+        mask[empty[legal]] = True
+        if self.ko_constraint is not None:
+            mask[self.ko_constraint] = False
+        return mask
 
     def get_twoD_board(self):
         """
@@ -152,6 +329,7 @@ class SimpleGoBoard(object):
         self.NS = size + 1
         self.WE=  1
         self.check_suicide = True
+        self.check_hash = False # verify the incremental hash after every move
         self._is_empty = True
         self.ko_constraint = None
         self.passes_white = 0
@@ -162,11 +340,11 @@ class SimpleGoBoard(object):
         self.winner = None
         self.num_pass = 0
         self.maxpoint = size*size + 3*(size+1)  
-        self.liberty_dp = np.ones((self.maxpoint),dtype=np.int16)*-1
         self.moves = [] # stack of moves
         self.ko_constraints = [] # stack of ko constraines
         self.captured_stones = [] # stacke of captured stones
         self.pass_record = []
+        self.block_records = [] # stack of block changes made by each move
         self.last_move = None
         self.last2_move = None
 
@@ -197,30 +375,85 @@ class SimpleGoBoard(object):
         3  0  0  0  3
         3  3  3  3  3
         """
-        self.board = np.ones((self.maxpoint),dtype=np.int16)*BORDER
-        self._empty_filling(self.board)
-        self._empty_positions = list(np.where(self.board == 0)[0])
-        # Init neighbors dict
-        self.neighbors_dic = {}
-        for p in self._empty_positions:
-            self.neighbors_dic[p] = []
-            for n in self._neighbor_pos(p):
-                if self.board[n] == BORDER:
-                    continue
-                self.neighbors_dic[p].append(n)
+        self._tables = board_tables(size)
+        self.board = self._tables.initial_board.copy()
+        empty_points = self._tables.points
+        """
+        The empty points are kept in an indexed sparse set:
+        _empty_dense[:_empty_count] lists the empty points in no particular
+        order and _empty_index maps an empty point to its position in
+        _empty_dense, or -1. Adding and removing a point is O(1).
+        """
+        self._empty_dense = np.zeros((self.maxpoint),dtype=np.int32)
+        self._empty_dense[:len(empty_points)] = empty_points
+        self._empty_index = np.ones((self.maxpoint),dtype=np.int32)*-1
+        self._empty_index[empty_points] = np.arange(len(empty_points))
+        self._empty_count = len(empty_points)
+        self.neighbors_dic = self._tables.neighbors_dic
+        """
+        Blocks are maintained incrementally by move and undo_move.
+        block_anchor maps every stone to the anchor of its block, and
+        -1 for points without a stone. For every anchor, block_stones holds
+        the list of stones in the block and block_libs the set of its
+        liberties.
+        """
+        self.block_anchor = np.ones((self.maxpoint),dtype=np.int32)*-1
+        self.block_stones = {}
+        self.block_libs = {}
+        self._stone_keys, self._ko_keys, self._to_play_key = zobrist_keys(self.maxpoint)
+        self._stone_hash = 0
+        """
+        pattern_codes holds the 3x3 pattern around every point as an int:
+        the 8 cells around the point in row order take 2 bits each, lowest
+        bits first, with the color codes of the board array. The codes are
+        only meaningful for empty points, see pattern_code in pattern.py.
+        Placing or removing a stone updates the codes of the up to 8 points
+        around it.
+        """
+        self.pattern_codes = self._tables.initial_pattern_codes[:]
 
     def _neighbors(self,point):
         return self.neighbors_dic[point]
     
     def _neighbor_pos(self, point):
-        return [point-1, point+1, point-self.NS, point+self.NS]
+        return self._tables.neighbor_lists[point]
+
+    # mutable arrays and lists that copy_into copies, everything else not
+    # copied explicitly is either immutable or a table shared by boards of a size
+    _copied_arrays = ('board', 'block_anchor', '_empty_dense', '_empty_index')
+    _copied_lists = ('moves', 'ko_constraints', 'captured_stones',
+                     'pass_record', 'block_records', 'pattern_codes')
 
     def copy(self):
-        """Return an independent copy of this Board."""
-        copy_board = SimpleGoBoard(self.size)
-        copy_board.__dict__ = copy.deepcopy(self.__dict__)
-        assert copy_board.board.all() == self.board.all()
-        return copy_board
+        """
+        Return an independent copy of this Board.
+        The BoardTables and the Zobrist keys are shared with
+        the copy, only the mutable state is copied.
+        """
+        copy_board = SimpleGoBoard.__new__(SimpleGoBoard)
+        return self.copy_into(copy_board)
+
+    def copy_into(self, dst):
+        """
+        Make dst an independent copy of this Board and return it.
+        If dst is a board of the same size its arrays are reused, so a
+        preallocated simulation board can be reset to this position
+        without building a new board.
+        """
+        dst_arrays = [getattr(dst, name, None) for name in self._copied_arrays]
+        dst.__dict__.update(self.__dict__)
+        for name, dst_array in zip(self._copied_arrays, dst_arrays):
+            array = getattr(self, name)
+            if dst_array is not None and dst_array.shape == array.shape:
+                dst_array[:] = array
+            else:
+                dst_array = array.copy()
+            setattr(dst, name, dst_array)
+        for name in self._copied_lists:
+            setattr(dst, name, getattr(self, name)[:])
+        dst.block_stones = {a: stones[:] for a, stones in self.block_stones.items()}
+        dst.block_libs = {a: set(libs) for a, libs in self.block_libs.items()}
+        return dst
 
     def get_empty_points(self):
         """
@@ -230,21 +463,42 @@ class SimpleGoBoard(object):
         Return:
         list of empty poisitions
         """
-        return self._empty_positions[:]
+        return self._empty_dense[:self._empty_count].tolist()
 
-    def _empty_filling(self,board):
+    def get_empty_points_view(self):
         """
-        Fills points inside board with EMPTY
-        Arguments
-        ---------
-        board : numpy array
-            receives a numpy array filled with BORDER
+        Return the empty points as a read-only numpy view, without copying.
+        For callers that only iterate over the points; the view is only
+        valid until the next move or undo_move.
+        """
+        view = self._empty_dense[:self._empty_count]
+        view.flags.writeable = False
+        return view
+
+    def _add_empty(self, point):
+        self._empty_dense[self._empty_count] = point
+        self._empty_index[point] = self._empty_count
+        self._empty_count += 1
 
+    def _remove_empty(self, point):
         """
-        for ind in range(1,self.size+1,1):
-            indices = [j for j in range(ind*self.NS + 1,ind*self.NS+self.size+1,1)]
-            np.put(board,indices, EMPTY)
+        Swap-remove point from the empty points
+        """
+        i = self._empty_index[point]
+        self._empty_count -= 1
+        last = self._empty_dense[self._empty_count]
+        self._empty_dense[i] = last
+        self._empty_index[last] = i
+        self._empty_index[point] = -1
 
+    def _update_pattern_codes(self, point, delta):
+        """
+        Add delta, the change of the color code at point, to the pattern
+        codes of the points around it.
+        """
+        codes = self.pattern_codes
+        for n, weight in self._tables.pattern_updates[point]:
+            codes[n] += delta * weight
 
     def is_eye(self,point,color):
         """
@@ -334,64 +588,128 @@ class SimpleGoBoard(object):
     def _liberty_point(self, point, color):
         """
         Helper function for returning number of liberty and 
-        last liberty for the point
-        """
-        group_points = [point]
-        liberty = 0
-        met_points = [point]
-        while group_points:
-            p=group_points.pop()
-            met_points.append(p)
-            neighbors = self._neighbors(p)
-            for n in neighbors:
-                if n not in met_points:
-                    assert self.board[n] != BORDER
-                    if self.board[n] == color: 
-                        group_points.append(n)
-                    elif self.board[n]==EMPTY:
-                        liberty += 1
-                        single_lib_point = n
-                    met_points.append(n)
-        if liberty == 1:
-            return liberty, single_lib_point
-        return liberty, None
-
-    def _liberty_flood_rec(self,fboard,point,color):
-        fboard[point] = FLOODFILL
-        neighbors = self._neighbors(point)
-        for n in neighbors:
-            if fboard[n] == EMPTY:
-                return True,n
-            if fboard[n] == color:
-                res,lp=self._liberty_flood_rec(fboard,n,color)
-                if res:
-                    return True, lp
-        return False, None
-
-    def _liberty_flood(self, point):
-        """
-        This function find the liberties of flood filled board.
-        return True if it finds any liberty and False otherwise
-        Arguments
-        ---------
-        board : numpy array
+        last liberty for the block of the stone at point
+        """
+        assert self.board[point] == color
+        libs = self.block_libs[self.block_anchor[point]]
+        if len(libs) == 1:
+            return 1, next(iter(libs))
+        return len(libs), None
 
-        Return
-        ---------
-        bool:
-             whether the flood filled group in the board has any liberty
+    def _block_liberties(self, point):
         """
-        dp_point=self.liberty_dp[point]
-        if dp_point != -1 and self.board[dp_point] == EMPTY:
-            return True, dp_point
-        fboard = np.array(self.board, copy=True)
-        color = fboard[point]
-        res,lp = self._liberty_flood_rec(fboard,point,color)
-        if(res==True):
-            return res, lp
-        else:
-            return res, fboard
+        Return the set of liberties of the block containing the stone at point.
+        The set is owned by the board and must not be modified.
+        """
+        return self.block_libs[self.block_anchor[point]]
+
+    def _in_atari(self, point):
+        """
+        Whether the block containing the stone at point has a single liberty
+        """
+        return len(self.block_libs[self.block_anchor[point]]) == 1
+
+    def _is_suicide(self, point, color):
+        """
+        Whether playing color at the empty point would leave its block
+        without liberties, without capturing anything.
+        Only looks at the blocks around point, the board is not modified.
+        """
+        for n in self._neighbors(point):
+            n_color = self.board[n]
+            if n_color == EMPTY:
+                return False
+            num_lib = len(self.block_libs[self.block_anchor[n]])
+            if n_color == color:
+                if num_lib > 1:
+                    return False
+            elif num_lib == 1:
+                # the only liberty of the opponent block is point: capture
+                return False
+        return True
 
+    def selfatari(self, points, color):
+        """
+        For each of the points, whether playing color there is a legal move
+        that leaves the block of the new stone with a single liberty.
+        Returns a numpy bool array aligned with points.
+        Most points are settled at once from the liberty counts of the
+        blocks next to them, as in legal_mask; only the points where the
+        liberty sets of the blocks have to be merged go through _selfatari.
+        Short lists, such as the single move tested in a playout, are
+        looped over instead: below about 24 points the fixed cost of the
+        numpy calls is higher than the loop.
+        """
+        if len(points) < 24:
+            return np.array([self._selfatari(p, color) for p in points], dtype=np.bool_)
+        points = np.asarray(points, dtype=np.int32)
+        board = self.board
+        opp = GoBoardUtil.opponent(color)
+        nb_points = self._tables.neighbor_table[points]
+        nb = board[nb_points]
+        # liberty count by anchor, see legal_mask
+        anchor_libs = np.zeros((self.maxpoint),dtype=np.int32)
+        anchor_libs[list(self.block_libs)] = [len(libs) for libs in self.block_libs.values()]
+        nb_libs = anchor_libs[self.block_anchor[nb_points]]
+        friend = nb == color
+        num_empty = (nb == EMPTY).sum(axis=1)
+        # two empty neighbors or a friendly block with more than two
+        # liberties leave at least two liberties
+        maybe = ((board[points] == EMPTY) & (num_empty < 2)
+                 & ~(friend & (nb_libs > 2)).any(axis=1))
+        if self.ko_constraint is not None:
+            maybe &= points != self.ko_constraint
+        # without friendly blocks or captures, the liberties are the
+        # empty neighbors
+        simple = ~(friend | ((nb == opp) & (nb_libs == 1))).any(axis=1)
+        result = maybe & simple & (num_empty == 1)
+        for i in np.flatnonzero(maybe & ~simple).tolist():
+            result[i] = self._selfatari(int(points[i]), color)
+        return result
+
+    def _selfatari(self, point, color):
+        """
+        Self-atari test for one point. The liberties of the block the stone
+        would join are worked out from the liberties of the blocks around
+        point and the stones it would capture, the board is not modified.
+        """
+        board = self.board
+        if board[point] != EMPTY or point == self.ko_constraint:
+            return False
+        libs = set()
+        friend_anchors = []
+        captured = []
+        for n in self._neighbors(point):
+            n_color = board[n]
+            if n_color == EMPTY:
+                libs.add(n)
+                continue
+            a = self.block_anchor[n]
+            n_libs = self.block_libs[a]
+            if n_color == color:
+                if len(n_libs) > 2:
+                    # the block loses at most point
+                    return False
+                friend_anchors.append(a)
+                libs |= n_libs
+            elif len(n_libs) == 1:
+                # the capture makes n a liberty
+                libs.add(n)
+                if a not in captured:
+                    captured.append(a)
+        libs.discard(point)
+        if len(libs) != 1 or not captured:
+            return len(libs) == 1
+        # a single liberty from a captured stone next to point: other
+        # captured stones next to the friendly blocks are liberties too
+        for a in captured:
+            for s in self.block_stones[a]:
+                if s in libs:
+                    continue
+                for m in self._neighbors(s):
+                    if board[m] == color and self.block_anchor[m] in friend_anchors:
+                        return False
+        return True
 
     def _flood_fill(self, point):
         """
@@ -436,6 +754,7 @@ class SimpleGoBoard(object):
         if point == None: #play a pass move
             msg = "Playing a pass move with %s color is permitted"%(color)
             self.num_pass += 1
+            self.block_records.append(None)
             game_ended = self.end_of_game()
             if game_ended:
                 return True, "Game has ended!", None
@@ -448,56 +767,170 @@ class SimpleGoBoard(object):
         if point == self.ko_constraint:
             msg ="KO move is not permitted!"
             return False , msg, None
+        if self.check_suicide and self._is_suicide(point, color):
+            c = self._point_to_coord(point)
+            msg = "Suicide move with color %s in the row and column: %d %d "%(color, c[0],c[1])
+            return False, msg, None
         in_enemy_eye = self._is_eyeish(point) == GoBoardUtil.opponent(color)
-        self.board[point] = color
         self._is_empty = False
+        block_record = self._place_stone(point, color)
+        self.block_records.append(block_record)
         caps = []
         single_captures = []
-        neighbors = self._neighbors(point)
-        cap_inds = None
-        for n in neighbors:
-            assert self.board[n] != BORDER
-            if self.board[n] != color:
-                if self.board[n] != EMPTY:
-                    hasLiberty, fboard = self._liberty_flood(n)
-                    if not hasLiberty:
-                        cap_inds = fboard==FLOODFILL
-                        caps.extend(list(*np.where(fboard==FLOODFILL)))
-                        num_captures = np.sum(cap_inds)
-                        if num_captures == self.size*self.size:
-                            self._is_empty = True
-                        if num_captures == 1:
-                            single_captures.append(n)
-                        if color == WHITE:
-                            self.white_captures += num_captures
-                        else :
-                            self.black_captures += num_captures
-                        self.liberty_dp[cap_inds] = -1
-                        self.board[cap_inds] = EMPTY
+        for _, stones in block_record[2]:
+            caps.extend(stones)
+            num_captures = len(stones)
+            if num_captures == self.size*self.size:
+                self._is_empty = True
+            if num_captures == 1:
+                single_captures.append(stones[0])
+            if color == WHITE:
+                self.white_captures += num_captures
+            else :
+                self.black_captures += num_captures
         self.ko_constraint = single_captures[0] if in_enemy_eye and len(single_captures) == 1 else None
-        if (not self.check_suicide):
-            #not check suicidal move
-            c = self._point_to_coord(point)
-            msg = "Playing a move with %s color in the row and column %d %d is permitted"%(color,c[0],c[1])
-            return True, msg, caps
+        c = self._point_to_coord(point)
+        msg = "Playing a move with %s color in the row and column %d %d is permitted"%(color,c[0],c[1])
+        return True, msg, caps
+
+    def _place_stone(self, point, color):
+        """
+        Put a stone of color on the empty point, merge it with the adjacent
+        blocks of the same color and remove adjacent opponent blocks that
+        lost their last liberty.
+
+        Returns
+        -------
+        block_record : tuple
+            (merge, opp_anchors, captured) which is all that _undo_stone
+            needs to restore the previous blocks:
+            merge : (anchor, old_len, old_libs, absorbed) of the block that
+                received the stone, old_libs is None for a new block and
+                absorbed is a list of (anchor, stones, libs) of merged blocks
+            opp_anchors : anchors of the opponent blocks that lost point
+                as a liberty
+            captured : list of (anchor, stones) of the captured blocks
+        """
+        board = self.board
+        block_anchor = self.block_anchor
+        board[point] = color
+        self._stone_hash ^= self._stone_keys[color][point]
+        self._update_pattern_codes(point, color)
+        friend_anchors = []
+        opp_anchors = []
+        new_libs = set()
+        for n in self._neighbors(point):
+            n_color = board[n]
+            if n_color == EMPTY:
+                new_libs.add(n)
+                continue
+            a = block_anchor[n]
+            if n_color == color:
+                if a not in friend_anchors:
+                    friend_anchors.append(a)
+            elif a not in opp_anchors:
+                opp_anchors.append(a)
+
+        if not friend_anchors:
+            block_anchor[point] = point
+            self.block_stones[point] = [point]
+            self.block_libs[point] = new_libs
+            merge = (point, 0, None, [])
         else:
-            res,lp=self._liberty_flood(point)
-            if res==True:
-                #non suicidal move
-                self.liberty_dp[point]=lp
-                c = self._point_to_coord(point)
-                msg = "Playing a move with %s color in the row and column %d %d is permitted"%(color,c[0],c[1])
-                return True, msg, caps
-            else:
-                # undoing the move because of being suicidal
-                # think cap_inds must be None?
-                self.board[point] = EMPTY
-                if cap_inds!= None:
-                    self.board[cap_inds] = GoBoardUtil.opponent(color)
-                c = self._point_to_coord(point)
-                msg = "Suicide move with color %s in the row and column: %d %d "%(color, c[0],c[1])
-                return False, msg, None
-    
+            # the largest block keeps its anchor, the others are relabeled
+            anchor = max(friend_anchors, key=lambda a: len(self.block_stones[a]))
+            stones = self.block_stones[anchor]
+            old_len = len(stones)
+            old_libs = self.block_libs[anchor]
+            libs = old_libs | new_libs
+            absorbed = []
+            for a in friend_anchors:
+                if a == anchor:
+                    continue
+                a_stones = self.block_stones.pop(a)
+                a_libs = self.block_libs.pop(a)
+                absorbed.append((a, a_stones, a_libs))
+                block_anchor[a_stones] = anchor
+                stones.extend(a_stones)
+                libs |= a_libs
+            block_anchor[point] = anchor
+            stones.append(point)
+            libs.discard(point)
+            self.block_libs[anchor] = libs
+            merge = (anchor, old_len, old_libs, absorbed)
+
+        captured = []
+        for a in opp_anchors:
+            a_libs = self.block_libs[a]
+            a_libs.discard(point)
+            if not a_libs:
+                captured.append((a, self._remove_block(a, color)))
+        return merge, opp_anchors, captured
+
+    def _remove_block(self, anchor, color):
+        """
+        Remove the captured block with the given anchor. The emptied points
+        become liberties of the adjacent blocks of color.
+        Returns the list of removed stones.
+        """
+        stones = self.block_stones.pop(anchor)
+        del self.block_libs[anchor]
+        self.board[stones] = EMPTY
+        self.block_anchor[stones] = -1
+        opp = GoBoardUtil.opponent(color)
+        keys = self._stone_keys[opp]
+        for s in stones:
+            self._stone_hash ^= keys[s]
+            self._update_pattern_codes(s, -opp)
+        for s in stones:
+            for n in self._neighbors(s):
+                if self.board[n] == color:
+                    self.block_libs[self.block_anchor[n]].add(s)
+        return stones
+
+    def _undo_stone(self, point, color, block_record):
+        """
+        Reverse _place_stone for the stone of color at point,
+        in the opposite order of the changes.
+        Lists and sets in block_record are copied rather than reused, so
+        the records stay unchanged and can be shared between board copies.
+        """
+        board = self.board
+        block_anchor = self.block_anchor
+        merge, opp_anchors, captured = block_record
+        opp = GoBoardUtil.opponent(color)
+        opp_keys = self._stone_keys[opp]
+        for a, stones in reversed(captured):
+            board[stones] = opp
+            block_anchor[stones] = a
+            for s in stones:
+                self._stone_hash ^= opp_keys[s]
+                self._update_pattern_codes(s, opp)
+            self.block_stones[a] = stones[:]
+            self.block_libs[a] = set()
+            for s in stones:
+                for n in self._neighbors(s):
+                    if board[n] == color:
+                        self.block_libs[block_anchor[n]].discard(s)
+        for a in opp_anchors:
+            self.block_libs[a].add(point)
+
+        anchor, old_len, old_libs, absorbed = merge
+        if old_libs is None:
+            del self.block_stones[anchor]
+            del self.block_libs[anchor]
+        else:
+            del self.block_stones[anchor][old_len:]
+            self.block_libs[anchor] = set(old_libs)
+            for a, a_stones, a_libs in absorbed:
+                block_anchor[a_stones] = a
+                self.block_stones[a] = a_stones[:]
+                self.block_libs[a] = set(a_libs)
+        board[point] = EMPTY
+        block_anchor[point] = -1
+        self._stone_hash ^= self._stone_keys[color][point]
+        self._update_pattern_codes(point, -color)
+
     def _diag_neighbors(self, point):
         """
         All diagonal neighbors of the point
@@ -510,8 +943,7 @@ class SimpleGoBoard(object):
         points : list of int
             coordinate of points which are diagnoal neighbors of the given point
         """
-        return [point-self.NS-1, point-self.NS+1,
-                point+self.NS-1, point+self.NS+1]
+        return self._tables.diag_lists[point]
 
     def _border_removal(self, points):
         """
@@ -695,7 +1127,7 @@ class SimpleGoBoard(object):
         S_eyes = {} # For each block, record one point eyes it connects
         
         # find E
-        empty_points = self.get_empty_points()
+        empty_points = self.get_empty_points_view()
         for point in empty_points:
             if self.is_eye(point, color):
                 E[point] = set()
@@ -778,20 +1210,17 @@ class SimpleGoBoard(object):
         patterns :
         Set of patterns in the same format of what michi pattern base provides. Please refer to pattern.py to see the format of the pattern.
         """
-        positions = [point-self.NS-1, point-self.NS, point-self.NS+1,
-                     point-1, point, point+1,
-                     point+self.NS-1, point+self.NS, point+self.NS+1]
-                     
+        window = self.board[self._tables.window_table[point]]
         pattern = ""
-        for d in positions:
-            if self.board[d] == self.current_player:
+        for c in window:
+            if c == self.current_player:
                 pattern += 'X'
-            elif self.board[d] == GoBoardUtil.opponent(self.current_player):
-                pattern += 'x'
-            elif self.board[d] == EMPTY:
+            elif c == EMPTY:
                 pattern += '.'
-            elif self.board[d] == BORDER:
+            elif c == BORDER:
                 pattern += ' '
+            else:
+                pattern += 'x'
         return pattern
     
     def last_moves_empty_neighbors(self):